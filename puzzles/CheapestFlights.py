@@ -24,6 +24,16 @@ For example, our traveler wants to go from JFK to LAX with up to
 Due to some improbably low flight prices, the cheapest itinerary would be
 JFK -> ATL -> ORD -> LAX, costing $440.
 """
+import csv
+import heapq
+import itertools
+import mmap
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
 CONNECTIONS = (
     ('JFK', 'ATL', 150),
     ('ATL', 'SFO', 400),
@@ -34,15 +44,679 @@ CONNECTIONS = (
     ('JFK', 'LAX', 500),
 )
 
-def find_cheapest_route(source, destination, max_connections):
+_GRAPH_SERIALS = itertools.count()
+
+# the number of recent fare changes a FlightGraph logs for CostTable
+_CHANGE_LOG_SIZE = 1024
+
+
+class FlightGraph:
+    """
+    An index of direct flights, built once from a list of connections in
+    the form
+    [
+        (SOURCE, DESTINATION, PRICE),
+        ...
+    ]
+    Airport codes are interned to integer ids and the legs are held in
+    compressed sparse row (CSR) columns:
+        _offsets      - the legs of airport A are [_offsets[A], _offsets[A+1])
+        _destinations - int32 destination id of each leg
+        _prices       - int64 (or float64 if any fare has pence) leg prices
+    so looking up the departures from an airport only costs the number of
+    flights leaving it, and no per-leg Python objects are kept.
+
+    Fares can be changed with add_leg, remove_leg and update_price. A
+    price is patched in the columns where it can be; anything else is
+    held in a small per-airport overlay (_patches) that hides the
+    matching column legs until compact() folds it back in. The legs of an
+    airport with an overlay are merged into a list once after each change
+    to it and kept in _patched, so an airport with many overlaid legs
+    costs memory for that list until compact() is called.
+
+    Only the most recent _CHANGE_LOG_SIZE changes are logged (in _changed)
+    for CostTable to check; a table that falls further behind than that
+    is rebuilt.
+    """
+    def __init__(self, connections=()):
+        self._start()
+        self._ids = {}
+        self._names = []
+        sources = array('i')
+        destinations = array('i')
+        prices = array('q')
+        for (source, destination, price) in connections:
+            sources.append(self._intern(source))
+            destinations.append(self._intern(destination))
+            if prices.typecode == 'q' and not isinstance(price, int):
+                prices = array('d', prices)
+            prices.append(price)
+        self._build(sources, destinations, prices)
+
+    def _start(self):
+        self._serial = next(_GRAPH_SERIALS)
+        self._changes = 0
+        # _patches[AIRPORT_ID] = {DESTINATION_ID: PRICE or None, ...}
+        self._patches = {}
+        # _patched[AIRPORT_ID] = the merged legs of a patched airport
+        self._patched = {}
+        # _changed[N] = (SOURCE_ID, DESTINATION_ID, PRICE or None) for the
+        # N'th of the most recent changes, so that a CostTable can tell if
+        # a change affects it
+        self._changed = []
+        # (VERSION, ARRIVALS, BOUNDS) cached by _reverse_index
+        self._reverse = None
+
+    def _intern(self, airport):
+        airport_id = self._ids.get(airport)
+        if airport_id is None:
+            airport_id = len(self._names)
+            self._ids[airport] = airport_id
+            self._names.append(airport)
+        return airport_id
+
+    def _build(self, sources, destinations, prices):
+        """
+        Counting sort of the leg columns by source airport into CSR form,
+        keeping the original order of the legs leaving each airport
+        """
+        airports = len(self._names)
+        offsets = array('q', bytes(8 * (airports + 1)))
+        for source_id in sources:
+            offsets[source_id + 1] += 1
+        for airport_id in range(airports):
+            offsets[airport_id + 1] += offsets[airport_id]
+
+        position = array('q', offsets)
+        self._destinations = array('i', bytes(4 * len(sources)))
+        self._prices = array(prices.typecode, bytes(prices.itemsize * len(sources)))
+        for (leg, source_id) in enumerate(sources):
+            index = position[source_id]
+            position[source_id] = index + 1
+            self._destinations[index] = destinations[leg]
+            self._prices[index] = prices[leg]
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._names)
+
+    def __reduce_ex__(self, protocol):
+        if getattr(self, "_path", None) is not None and not self._patches:
+            # a mapped graph is sent by name so that the receiving
+            # process maps the same snapshot rather than a copy
+            return (load_graph, (self._path,))
+        return object.__reduce_ex__(self, protocol)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_mapped", None)
+        state.pop("_path", None)
+        # a copy is a different graph, so these would never be used
+        state["_reverse"] = None
+        state["_changed"] = []
+        for name in ("_offsets", "_destinations", "_prices"):
+            column = state[name]
+            if isinstance(column, memoryview):
+                state[name] = array(column.format, column.tobytes())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # a copy is a different graph as far as any cache is concerned
+        self._serial = next(_GRAPH_SERIALS)
+
+    def version(self):
+        """
+        Returns a value that identifies this graph and changes whenever
+        any of its fares do, for keying cached results
+        """
+        return (self._serial, self._changes)
+
+    def __contains__(self, airport):
+        return airport in self._ids
+
+    def leg_count(self):
+        """
+        Returns the total number of direct flights
+        """
+        if not self._patches:
+            return len(self._destinations)
+        return sum(
+            len(self._patched_legs(airport_id)) for airport_id in range(len(self))
+        )
+
+    def airport_id(self, airport):
+        """
+        Returns the integer id of an airport, or None if it is unknown
+        """
+        return self._ids.get(airport)
+
+    def airport_name(self, airport_id):
+        """
+        Returns the airport code for an integer id
+        """
+        return self._names[airport_id]
+
+    def legs(self, airport_id):
+        """
+        Returns an iterator over the outgoing legs of an airport by id,
+        each of the form (DESTINATION_ID, PRICE)
+        """
+        if airport_id in self._patches:
+            return iter(self._patched_legs(airport_id))
+        if airport_id + 1 >= len(self._offsets):
+            # added since the columns were built
+            return iter(())
+        first = self._offsets[airport_id]
+        last = self._offsets[airport_id + 1]
+        return zip(self._destinations[first:last], self._prices[first:last])
+
+    def leg(self, airport_id, index):
+        """
+        Returns the index'th leg leaving an airport as (DESTINATION_ID, PRICE)
+        """
+        if airport_id in self._patches:
+            return self._patched_legs(airport_id)[index]
+        position = self._offsets[airport_id] + index
+        return (self._destinations[position], self._prices[position])
+
+    def _column_legs(self, airport_id):
+        if airport_id + 1 >= len(self._offsets):
+            return []
+        first = self._offsets[airport_id]
+        last = self._offsets[airport_id + 1]
+        return list(zip(self._destinations[first:last], self._prices[first:last]))
+
+    def _patched_legs(self, airport_id):
+        patches = self._patches.get(airport_id)
+        if not patches:
+            return self._column_legs(airport_id)
+        legs = self._patched.get(airport_id)
+        if legs is None:
+            legs = [
+                leg for leg in self._column_legs(airport_id)
+                if leg[0] not in patches
+            ]
+            for (destination_id, price) in patches.items():
+                if price is not None:
+                    legs.append((destination_id, price))
+            self._patched[airport_id] = legs
+        return legs
+
+    def _reverse_index(self):
+        """
+        Returns (ARRIVALS, BOUNDS) for the fares as they are now
+            ARRIVALS - ARRIVALS[AIRPORT_ID] = [(PREVIOUS_ID, PRICE), ...]
+            BOUNDS   - an OrderedDict in which _bounds_to remembers the
+                       bounds of recent destinations
+        Both are built once and kept until the fares next change.
+        """
+        version = self.version()
+        if self._reverse is None or self._reverse[0] != version:
+            arrivals = [[] for _ in range(len(self))]
+            for airport_id in range(len(self)):
+                for (next_id, price) in self.legs(airport_id):
+                    arrivals[next_id].append((airport_id, price))
+            self._reverse = (version, arrivals, OrderedDict())
+        return self._reverse[1:]
+
+    def departures(self, airport):
+        """
+        Returns the direct flights leaving an airport in the form
+        [(DESTINATION, PRICE), ...]
+        """
+        airport_id = self._ids.get(airport)
+        if airport_id is None:
+            return []
+        names = self._names
+        return [
+            (names[destination_id], price)
+            for (destination_id, price) in self.legs(airport_id)
+        ]
+
+    def _has_leg(self, source_id, destination_id):
+        return any(
+            leg[0] == destination_id for leg in self.legs(source_id)
+        )
+
+    def _change(self, source_id, destination_id, price):
+        self._patched.pop(source_id, None)
+        self._changed.append((source_id, destination_id, price))
+        self._changes += 1
+        if len(self._changed) > 2 * _CHANGE_LOG_SIZE:
+            del self._changed[:-_CHANGE_LOG_SIZE]
+
+    def _changes_since(self, seen):
+        """
+        Returns the changes made after the first seen changes, or None if
+        they are no longer all in the log
+        """
+        dropped = self._changes - len(self._changed)
+        if seen < dropped:
+            return None
+        return self._changed[seen - dropped:]
+
+    def add_leg(self, source, destination, price):
+        """
+        Adds a direct flight, creating any airports that are new
+
+        RAISES
+            ValueError
+            - when the flight already exists, use update_price instead
+        """
+        source_id = self._intern(source)
+        destination_id = self._intern(destination)
+        if self._has_leg(source_id, destination_id):
+            raise ValueError("flight %s -> %s already exists" % (source, destination))
+        self._patches.setdefault(source_id, {})[destination_id] = price
+        self._change(source_id, destination_id, price)
+
+    def remove_leg(self, source, destination):
+        """
+        Removes the direct flight(s) from source to destination
+
+        RAISES
+            ValueError
+            - when there is no such flight
+        """
+        (source_id, destination_id) = self._existing_leg(source, destination)
+        self._patches.setdefault(source_id, {})[destination_id] = None
+        self._change(source_id, destination_id, None)
+
+    def update_price(self, source, destination, price):
+        """
+        Changes the price of the direct flight(s) from source to destination
+
+        RAISES
+            ValueError
+            - when there is no such flight
+        """
+        (source_id, destination_id) = self._existing_leg(source, destination)
+        patches = self._patches.get(source_id)
+        if (
+            isinstance(self._prices, array)
+            and not (patches and destination_id in patches)
+            and (self._prices.typecode == 'd' or isinstance(price, int))
+        ):
+            # patch the columns in place
+            first = self._offsets[source_id]
+            last = self._offsets[source_id + 1]
+            for position in range(first, last):
+                if self._destinations[position] == destination_id:
+                    self._prices[position] = price
+        else:
+            self._patches.setdefault(source_id, {})[destination_id] = price
+        self._change(source_id, destination_id, price)
+
+    def _existing_leg(self, source, destination):
+        source_id = self._ids.get(source)
+        destination_id = self._ids.get(destination)
+        if (
+            source_id is None or destination_id is None
+            or not self._has_leg(source_id, destination_id)
+        ):
+            raise ValueError("no flight %s -> %s" % (source, destination))
+        return (source_id, destination_id)
+
+    def compact(self):
+        """
+        Rebuilds the columns with every change made so far folded in
+        """
+        (self._offsets, self._destinations, self._prices) = self._columns()
+        self._patches = {}
+        self._patched = {}
+        self._changed = []
+        self.__dict__.pop("_mapped", None)
+        self.__dict__.pop("_path", None)
+
+    def _columns(self):
+        """
+        Returns (OFFSETS, DESTINATIONS, PRICES) including any patches
+        """
+        if not self._patches and len(self._offsets) == len(self) + 1:
+            return (self._offsets, self._destinations, self._prices)
+        typecode = _typecode(self._prices)
+        offsets = array('q', [0])
+        destinations = array('i')
+        prices = array(typecode)
+        for airport_id in range(len(self)):
+            for (destination_id, price) in self.legs(airport_id):
+                if prices.typecode == 'q' and not isinstance(price, int):
+                    prices = array('d', prices)
+                destinations.append(destination_id)
+                prices.append(price)
+            offsets.append(len(destinations))
+        return (offsets, destinations, prices)
+
+
+def load_fares(path, delimiter=None):
+    """
+    Streams a fare table file into a FlightGraph. Each row of the file is
+        SOURCE,DESTINATION,PRICE
+    path      - the file name (or an open text file) to read
+    delimiter - the field separator, defaults to a tab for ".tsv" files
+                and a comma otherwise
+
+    Rows are parsed one at a time straight into the graph's columns, so
+    the raw rows are never held in memory. A leading header row is
+    skipped, as are blank rows.
+    """
+    if hasattr(path, "read"):
+        return FlightGraph(_read_fares(path, delimiter or ","))
+    if delimiter is None:
+        delimiter = "\t" if str(path).endswith(".tsv") else ","
+    with open(path, newline="") as fares:
+        return FlightGraph(_read_fares(fares, delimiter))
+
+def _read_fares(fares, delimiter):
+    for (line, row) in enumerate(csv.reader(fares, delimiter=delimiter)):
+        if not row:
+            continue
+        (source, destination, price) = row
+        try:
+            price = _parse_price(price)
+        except ValueError:
+            if line == 0:
+                # a header row
+                continue
+            raise ValueError("bad price %r on line %d" % (price, line + 1))
+        yield (source.strip(), destination.strip(), price)
+
+def _parse_price(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+_SNAPSHOT_MAGIC = b"FLTGRAPH"
+_SNAPSHOT_VERSION = 1
+# MAGIC, VERSION, LITTLE_ENDIAN, PRICE_TYPECODE, AIRPORTS, LEGS, NAMES_SIZE
+_SNAPSHOT_HEADER = struct.Struct("=8sHBcQQQ4x")
+
+
+def save_graph(graph, path):
+    """
+    Writes a FlightGraph to a single binary snapshot file that load_graph
+    can map straight back into memory.
+
+    The file is a fixed header followed by the CSR offsets, prices and
+    destinations columns and finally the NUL separated airport codes.
+    Every column starts on an 8 byte boundary.
+    """
+    names = "\0".join(graph._names).encode("utf-8")
+    (offsets, destinations, prices) = graph._columns()
+    with open(path, "wb") as snapshot:
+        snapshot.write(
+            _SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC,
+                _SNAPSHOT_VERSION,
+                sys.byteorder == "little",
+                _typecode(prices).encode("ascii"),
+                len(graph._names),
+                len(destinations),
+                len(names)
+            )
+        )
+        snapshot.write(offsets)
+        snapshot.write(prices)
+        snapshot.write(destinations)
+        snapshot.write(names)
+
+def _typecode(column):
+    # arrays built in memory have a typecode, mapped columns a format
+    return getattr(column, "typecode", None) or column.format
+
+def load_graph(path):
+    """
+    Maps a snapshot written by save_graph into a read only FlightGraph.
+
+    The columns are used in place from the mapped file, so loading costs
+    the same however many legs there are, and processes that load the
+    same snapshot share its pages.
+
+    RAISES
+        ValueError
+        - when the file is not a snapshot this version can read
+        - when the file is truncated or has trailing data
+    """
+    with open(path, "rb") as snapshot:
+        mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < _SNAPSHOT_HEADER.size:
+        raise ValueError("not a flight graph snapshot %s" % (path))
+    (
+        magic, version, little_endian, typecode, airports, legs, names_size
+    ) = _SNAPSHOT_HEADER.unpack_from(mapped)
+    if magic != _SNAPSHOT_MAGIC:
+        raise ValueError("not a flight graph snapshot %s" % (path))
+    if version != _SNAPSHOT_VERSION:
+        raise ValueError("unsupported snapshot version %d" % (version))
+    if bool(little_endian) != (sys.byteorder == "little"):
+        raise ValueError("snapshot byte order does not match %s" % (path))
+    if typecode not in (b"q", b"d"):
+        raise ValueError("unsupported snapshot price type %r" % (typecode))
+    expected = (
+        _SNAPSHOT_HEADER.size + 8 * (airports + 1) + 12 * legs + names_size
+    )
+    if len(mapped) != expected:
+        raise ValueError(
+            "snapshot %s is %d bytes, expected %d"
+            % (path, len(mapped), expected)
+        )
+
+    view = memoryview(mapped)
+    position = _SNAPSHOT_HEADER.size
+    offsets = view[position:position + 8 * (airports + 1)].cast("q")
+    position += 8 * (airports + 1)
+    prices = view[position:position + 8 * legs].cast(typecode.decode("ascii"))
+    position += 8 * legs
+    destinations = view[position:position + 4 * legs].cast("i")
+    position += 4 * legs
+    names = bytes(view[position:position + names_size]).decode("utf-8")
+
+    graph = FlightGraph.__new__(FlightGraph)
+    graph._start()
+    graph._names = names.split("\0") if airports else []
+    graph._ids = dict((name, i) for (i, name) in enumerate(graph._names))
+    graph._offsets = offsets
+    graph._prices = prices
+    graph._destinations = destinations
+    # keep the mapping open for as long as the graph is in use
+    graph._mapped = mapped
+    graph._path = path
+    return graph
+
+
+_DEFAULT_GRAPH = None
+_DEFAULT_CONNECTIONS = None
+
+
+def default_graph():
+    """
+    Returns the FlightGraph for the module level CONNECTIONS, rebuilding
+    it only when CONNECTIONS has been replaced
+    """
+    global _DEFAULT_GRAPH, _DEFAULT_CONNECTIONS
+    if _DEFAULT_CONNECTIONS is not CONNECTIONS:
+        _DEFAULT_GRAPH = FlightGraph(CONNECTIONS)
+        _DEFAULT_CONNECTIONS = CONNECTIONS
+    return _DEFAULT_GRAPH
+
+
+class RouteCache:
+    """
+    A least recently used cache of query results for find_cheapest_route
+    and find_routes.
+
+    maxsize - the number of results kept before the least recently used
+              result is evicted
+    ttl     - an optional number of seconds after which a result expires
+    clock   - the time source used for ttl, defaults to time.monotonic
+
+    Results are keyed on the query and the graph's version(), so a result
+    is never served once a fare changes or CONNECTIONS is replaced.
+    """
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key):
+        """
+        Returns (True, RESULT) for a cached result or (False, None)
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            (result, expires) = entry
+            if expires is None or expires > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return (True, result)
+            del self._entries[key]
+        self.misses += 1
+        return (False, None)
+
+    def put(self, key, result):
+        expires = None
+        if self._ttl is not None:
+            expires = self._clock() + self._ttl
+        self._entries[key] = (result, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+def find_cheapest_route(source, destination, max_connections, graph=None,
+                        cache=None):
     """
     Returns the cheapest route that can be found for the constraints
     
     ([AIRPORT_1, AIRPORT_2...], TOTAL_COST)
+
+    graph - an optional FlightGraph to search, defaults to CONNECTIONS
+    cache - an optional RouteCache to answer repeated queries from
+
+    RAISES
+        ValueError
+        - when no route satisfies the constraints
+    """
+    if graph is None:
+        graph = default_graph()
+    if cache is None:
+        route = _cheapest_route(graph, source, destination, max_connections)
+    else:
+        key = (
+            "cheapest", source, destination, max_connections, graph.version()
+        )
+        (found, route) = cache.get(key)
+        if not found:
+            route = _cheapest_route(graph, source, destination, max_connections)
+            cache.put(key, route)
+        if route is not None:
+            # callers get their own copy of the airports
+            route = (list(route[0]), route[1])
+
+    if route is None:
+        raise ValueError(
+            "no route from %s to %s with up to %d connection(s)"
+            % (source, destination, max_connections)
+        )
+    return route
+
+def _cheapest_route(graph, source, destination, max_connections):
+    source_id = graph.airport_id(source)
+    destination_id = graph.airport_id(destination)
+    if source_id is None or destination_id is None:
+        return None
+    found = cheapest_path(
+        graph, source_id, destination_id, max_connections + 1
+    )
+    if found is None:
+        return None
+    return _named_route(graph, found, destination_id)
+
+def cheapest_path(graph, source_id, destination_id, max_legs,
+                  banned_airports=frozenset(), banned_legs=frozenset()):
+    """
+    graph           - the FlightGraph to search
+    source_id       - the id of the departure airport
+    destination_id  - the id of the final destination
+    max_legs        - the maximum number of flights that may be taken
+    banned_airports - ids of airports that may not be visited
+    banned_legs     - (AIRPORT_ID, LEG_INDEX) flights that may not be taken
+
+    A Dijkstra search over (AIRPORT, LEGS_USED) states. A state is only
+    expanded if its airport has not already been reached more cheaply
+    with the same or fewer legs, and no state is expanded once the leg
+    budget is spent.
+
+    Returns a tuple of the form
+    ([(AIRPORT_ID, LEG_INDEX), ...], TOTAL_COST)
+    listing each flight taken as graph.leg(AIRPORT_ID, LEG_INDEX),
+    or None if the destination cannot be reached
     """
-    return find_routes(source, destination, max_connections)[0]
+    # the path of each entry is a linked list of (FLIGHT, PREVIOUS)
+    # so that pushing a state never copies the route taken so far
+    sequence = itertools.count()
+    heap = [(0, 0, next(sequence), source_id, None)]
+    fewest_legs = {}
+    while heap:
+        (cost, legs, _, airport_id, path) = heapq.heappop(heap)
+        if airport_id == destination_id:
+            flights = []
+            while path is not None:
+                flights.append(path[0])
+                path = path[1]
+            flights.reverse()
+            return (flights, cost)
+
+        if fewest_legs.get(airport_id, max_legs + 1) <= legs:
+            # reached earlier, no dearer and with no more legs
+            continue
+        fewest_legs[airport_id] = legs
+        if legs == max_legs:
+            continue
+
+        for (index, (next_id, price)) in enumerate(graph.legs(airport_id)):
+            if fewest_legs.get(next_id, max_legs + 1) <= legs + 1:
+                continue
+            if next_id in banned_airports:
+                continue
+            if banned_legs and (airport_id, index) in banned_legs:
+                continue
+            heapq.heappush(
+                heap,
+                (
+                    cost + price,
+                    legs + 1,
+                    next(sequence),
+                    next_id,
+                    ((airport_id, index), path)
+                )
+            )
+    return None
 
-def find_routes(source, destination, max_connections):
+def _named_route(graph, path, destination_id):
+    """
+    Converts a cheapest_path result into
+    ([AIRPORT_1, AIRPORT_2, ...], TOTAL_COST)
+    """
+    (flights, cost) = path
+    airports = [graph.airport_name(a) for (a, _) in flights]
+    airports.append(graph.airport_name(destination_id))
+    return (airports, cost)
+
+def find_routes(source, destination, max_connections, graph=None,
+                cache=None):
     """
     returns a list of possible routes for the constraints in
     ascending price order
@@ -50,23 +724,402 @@ def find_routes(source, destination, max_connections):
         ([AIRPORT_1, AIRPORT_2, ...], TOTAL_COST_1),
         ...
     ]
+
+    graph - an optional FlightGraph to search, defaults to CONNECTIONS
+    cache - an optional RouteCache to answer repeated queries from
+    """
+    if cache is None:
+        return list(iter_routes(source, destination, max_connections, graph))
+
+    if graph is None:
+        graph = default_graph()
+    key = ("routes", source, destination, max_connections, graph.version())
+    (found, routes) = cache.get(key)
+    if not found:
+        routes = list(iter_routes(source, destination, max_connections, graph))
+        cache.put(key, routes)
+    return [(list(airports), cost) for (airports, cost) in routes]
+
+def iter_routes(source, destination, max_connections, graph=None):
+    """
+    A generator that yields the possible routes for the constraints
+    in ascending price order, one at a time
+        ([AIRPORT_1, AIRPORT_2, ...], TOTAL_COST)
+
+    graph - an optional FlightGraph to search, defaults to CONNECTIONS
+
+    This is Yen's k-shortest loopless paths algorithm with a leg budget;
+    each route is only searched for once the previous one has been
+    consumed, so asking for the cheapest few never enumerates the rest.
+    """
+    if graph is None:
+        graph = default_graph()
+    source_id = graph.airport_id(source)
+    destination_id = graph.airport_id(destination)
+    if source_id is None or destination_id is None:
+        return
+    max_legs = max_connections + 1
+
+    path = cheapest_path(graph, source_id, destination_id, max_legs)
+    if path is None:
+        return
+
+    accepted = []
+    candidates = []
+    seen = {tuple(path[0])}
+    sequence = itertools.count()
+    while True:
+        yield _named_route(graph, path, destination_id)
+        accepted.append(path[0])
+
+        # branch off the new route at each airport along it
+        (flights, cost) = path
+        root_cost = 0
+        banned_airports = set()
+        for (i, (spur_id, index)) in enumerate(flights):
+            root = flights[:i]
+            banned_legs = set(
+                route[i] for route in accepted
+                if len(route) > i and route[:i] == root
+            )
+            spur = cheapest_path(
+                graph, spur_id, destination_id, max_legs - i,
+                banned_airports, banned_legs
+            )
+            if spur is not None:
+                flights_taken = tuple(root) + tuple(spur[0])
+                if flights_taken not in seen:
+                    seen.add(flights_taken)
+                    heapq.heappush(
+                        candidates,
+                        (root_cost + spur[1], next(sequence), flights_taken)
+                    )
+            banned_airports.add(spur_id)
+            root_cost += graph.leg(spur_id, index)[1]
+
+        if not candidates:
+            return
+        (cost, _, flights_taken) = heapq.heappop(candidates)
+        path = (list(flights_taken), cost)
+
+class CostTable:
+    """
+    The cheapest fares from one airport to every other airport, for every
+    number of legs up to a limit.
+
+    It is built with a hop-bounded Bellman-Ford pass: round R relaxes the
+    legs leaving the airports whose fare improved in round R-1, so after
+    R rounds the table holds the cheapest fare using at most R legs.
+    Only the improvements made in each round are kept, along with the
+    flight that made them, which is enough to rebuild any route.
+
+    When fares in the graph change the table checks each change before it
+    is next used, and is only rebuilt if the change could alter one of
+    its fares.
+    """
+    def __init__(self, graph, source, max_connections):
+        self._graph = graph
+        self._source = source
+        self._max_legs = max_connections + 1
+        self._build()
+
+    def _build(self):
+        self._seen = self._graph._changes
+        self._source_id = self._graph.airport_id(self._source)
+        # _rounds[R] = {AIRPORT_ID: (COST, PREVIOUS_ID, LEG_INDEX), ...}
+        self._rounds = []
+        if self._source_id is not None:
+            self._relax()
+
+    def _relax(self):
+        graph = self._graph
+        best = {self._source_id: 0}
+        improved = {self._source_id: (0, None, None)}
+        self._rounds.append(improved)
+        for _ in range(self._max_legs):
+            previous = improved
+            improved = {}
+            for (airport_id, (cost, _, _)) in previous.items():
+                for (index, (next_id, price)) in enumerate(graph.legs(airport_id)):
+                    next_cost = cost + price
+                    if next_cost < best.get(next_id, next_cost + 1):
+                        best[next_id] = next_cost
+                        improved[next_id] = (next_cost, airport_id, index)
+            if not improved:
+                break
+            self._rounds.append(improved)
+
+    def refresh(self):
+        """
+        Applies any fare changes made to the graph since the table was
+        last used, returning True if the table had to be rebuilt
+        """
+        changed = self._graph._changes_since(self._seen)
+        if changed is None:
+            # too far behind to check each change
+            self._build()
+            return True
+        self._seen += len(changed)
+        if any(self._affected(*change) for change in changed):
+            self._build()
+            return True
+        return False
+
+    def _affected(self, source_id, destination_id, price):
+        if self._source_id is None:
+            # the source may have just been added
+            return source_id == self._graph.airport_id(self._source)
+        for improved in self._rounds:
+            entry = improved.get(destination_id)
+            if entry is not None and entry[1] == source_id:
+                # a cheapest fare was using this flight
+                return True
+        if price is None:
+            return False
+        for legs in range(min(len(self._rounds), self._max_legs)):
+            entry = self._rounds[legs].get(source_id)
+            if entry is not None:
+                (_, reached) = self._entry(destination_id, legs + 1)
+                if reached is None or entry[0] + price < reached[0]:
+                    # the flight is now a cheaper way to get there
+                    return True
+        return False
+
+    def _entry(self, airport_id, legs):
+        # the latest improvement using at most this many legs
+        for legs in range(min(legs, len(self._rounds) - 1), -1, -1):
+            entry = self._rounds[legs].get(airport_id)
+            if entry is not None:
+                return (legs, entry)
+        return (None, None)
+
+    def route(self, destination, max_connections=None):
+        """
+        Returns the cheapest route to destination in the form
+        ([AIRPORT_1, AIRPORT_2...], TOTAL_COST)
+        or None if it cannot be reached within max_connections, which
+        defaults to the limit the table was built for
+        """
+        if self._seen != self._graph._changes:
+            self.refresh()
+        graph = self._graph
+        destination_id = graph.airport_id(destination)
+        if destination_id is None:
+            return None
+        legs = self._max_legs
+        if max_connections is not None:
+            legs = min(legs, max_connections + 1)
+        (legs, entry) = self._entry(destination_id, legs)
+        if entry is None:
+            return None
+
+        cost = entry[0]
+        airports = [destination_id]
+        while entry[1] is not None:
+            airports.append(entry[1])
+            (legs, entry) = self._entry(entry[1], legs - 1)
+        airports.reverse()
+        return ([graph.airport_name(a) for a in airports], cost)
+
+
+def find_cheapest_routes_batch(queries, workers=None, graph=None):
+    """
+    Answers many queries of the form
+    [
+        (SOURCE, DESTINATION, MAX_CONNECTIONS),
+        ...
+    ]
+    returning, in the same order, the cheapest route for each as
+        ([AIRPORT_1, AIRPORT_2...], TOTAL_COST)
+    or None where no route satisfies the query.
+
+    graph   - an optional FlightGraph to search, defaults to CONNECTIONS
+    workers - the number of processes to spread the work over, by
+              default everything is answered in this process
+
+    Queries are grouped by source, so one CostTable answers every query
+    leaving the same airport. With workers each process receives the
+    graph once; a graph from load_graph is mapped by every worker, so
+    they all share the snapshot's pages.
     """
-    all_routes = sorted(
-        recursive_search([source], destination, 0),
-        key = lambda entry: entry[1]
+    if graph is None:
+        graph = default_graph()
+    by_source = {}
+    for (index, (source, destination, max_connections)) in enumerate(queries):
+        by_source.setdefault(source, []).append(
+            (index, destination, max_connections)
+        )
+
+    results = [None] * sum(len(group) for group in by_source.values())
+    groups = list(by_source.items())
+    if workers is None or workers <= 1:
+        answers = (_answer_source(graph, group) for group in groups)
+        for answered in answers:
+            for (index, route) in answered:
+                results[index] = route
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_start_worker,
+        initargs=(graph,)
+    ) as pool:
+        chunksize = max(1, len(groups) // (workers * 4))
+        for answered in pool.map(_answer_in_worker, groups, chunksize=chunksize):
+            for (index, route) in answered:
+                results[index] = route
+    return results
+
+_WORKER_GRAPH = None
+
+def _start_worker(graph):
+    global _WORKER_GRAPH
+    _WORKER_GRAPH = graph
+
+def _answer_in_worker(group):
+    return _answer_source(_WORKER_GRAPH, group)
+
+def _answer_source(graph, group):
+    (source, queries) = group
+    table = CostTable(
+        graph, source, max(query[2] for query in queries)
     )
-    result = []
-    for route in all_routes:
-        connections = len(route[0]) - 2
-        if (connections <= max_connections):
-            result.append(route)
-    return result
+    return [
+        (index, table.route(destination, max_connections))
+        for (index, destination, max_connections) in queries
+    ]
+
+def branch_and_bound_search(source, destination, max_connections,
+                            graph=None, max_cost=None, cheapest_only=False):
+    """
+    An exhaustive depth first search for routes within the constraints
+
+    graph         - an optional FlightGraph to search, defaults to CONNECTIONS
+    max_cost      - an optional price that no route may exceed
+    cheapest_only - only keep searching for routes cheaper than the
+                    cheapest found so far
+
+    The route being explored is a single stack that is extended and
+    backtracked, with a bitset of the airports on it to reject circular
+    routes in constant time. A branch is cut as soon as its cost plus the
+    cheapest possible fare on to the destination (ignoring connection
+    limits) is over budget, or it cannot reach the destination within the
+    remaining legs.
+
+    Will return a list of tuples, in the order they are found, of the form
+    [
+        ([AIRPORT_1, AIRPORT_2, ...], TOTAL_COST_1),
+        ...
+    ]
+    with cheapest_only this is the single cheapest route, if any
+    """
+    if graph is None:
+        graph = default_graph()
+    source_id = graph.airport_id(source)
+    destination_id = graph.airport_id(destination)
+    if source_id is None or destination_id is None:
+        return []
+    max_legs = max_connections + 1
+    (lowest_cost, fewest_legs) = _bounds_to(graph, destination_id)
+    if source_id not in lowest_cost:
+        return []
+
+    routes = []
+    limit = max_cost
+    visited = bytearray(len(graph))
+    visited[source_id] = 1
+    path = [source_id]
+    costs = [0]
+    departures = [graph.legs(source_id)]
+    while departures:
+        legs = len(path)
+        for (next_id, price) in departures[-1]:
+            if visited[next_id]:
+                continue
+            bound = lowest_cost.get(next_id)
+            if bound is None or legs + fewest_legs[next_id] > max_legs:
+                continue
+            cost = costs[-1] + price
+            if limit is not None and (
+                cost + bound > limit
+                or (cheapest_only and routes and cost + bound >= limit)
+            ):
+                continue
+            if next_id == destination_id:
+                route = ([graph.airport_name(a) for a in path], cost)
+                route[0].append(destination)
+                if cheapest_only:
+                    routes = [route]
+                    limit = cost
+                else:
+                    routes.append(route)
+                continue
+            # go deeper
+            visited[next_id] = 1
+            path.append(next_id)
+            costs.append(cost)
+            departures.append(graph.legs(next_id))
+            break
+        else:
+            # every departure has been explored, backtrack
+            departures.pop()
+            costs.pop()
+            visited[path.pop()] = 0
+    return routes
+
+# how many destinations' bounds a graph remembers, see _bounds_to
+_BOUNDS_TO_REMEMBER = 64
+
+def _bounds_to(graph, destination_id):
+    """
+    Returns ({AIRPORT_ID: LOWEST_COST}, {AIRPORT_ID: FEWEST_LEGS}) to the
+    destination for every airport that can reach it at all
+
+    The bounds of the most recent destinations are remembered on the
+    graph until its fares change, so repeated queries don't cost a pass
+    over every leg.
+    """
+    (arrivals, remembered) = graph._reverse_index()
+    bounds = remembered.get(destination_id)
+    if bounds is not None:
+        remembered.move_to_end(destination_id)
+        return bounds
+
+    lowest_cost = {}
+    heap = [(0, destination_id)]
+    while heap:
+        (cost, airport_id) = heapq.heappop(heap)
+        if airport_id in lowest_cost:
+            continue
+        lowest_cost[airport_id] = cost
+        for (previous_id, price) in arrivals[airport_id]:
+            if previous_id not in lowest_cost:
+                heapq.heappush(heap, (cost + price, previous_id))
+
+    fewest_legs = {destination_id: 0}
+    frontier = [destination_id]
+    while frontier:
+        reached = []
+        for airport_id in frontier:
+            for (previous_id, _) in arrivals[airport_id]:
+                if previous_id not in fewest_legs:
+                    fewest_legs[previous_id] = fewest_legs[airport_id] + 1
+                    reached.append(previous_id)
+        frontier = reached
 
-def recursive_search(route, destination, cost):
+    bounds = (lowest_cost, fewest_legs)
+    remembered[destination_id] = bounds
+    if len(remembered) > _BOUNDS_TO_REMEMBER:
+        remembered.popitem(last=False)
+    return bounds
+
+def recursive_search(route, destination, cost, graph=None):
     """
     route       - a list of connections
     destination - the final destination
     cost        - the current cost of this route
+    graph       - an optional FlightGraph to search, defaults to CONNECTIONS
 
     Will return a list of tuples of the following format
     [
@@ -79,31 +1132,33 @@ def recursive_search(route, destination, cost):
         # this is a circular route, do not continue searching
         return []
 
+    if graph is None:
+        graph = default_graph()
+
     routes = []
-    for connection in CONNECTIONS:
-        if connection[0] is route[-1]: # current airport
-            next_route = list(route) # take a copy
-            next_route.append(connection[1])
-            
-            next_cost = cost + connection[2]
-            
-            if connection[1] is destination:
-                # job done we've found our destination
-                routes.append(
-                    (next_route, next_cost)
-                )
-            else:
-                # search for a deeper route
-                sub_routes = recursive_search(
-                    next_route,
-                    destination,
-                    next_cost
-                )
-                for entry in sub_routes:
-                    routes.append(entry)
+    for (next_airport, price) in graph.departures(route[-1]):
+        next_route = list(route) # take a copy
+        next_route.append(next_airport)
 
-    return routes
+        next_cost = cost + price
 
+        if next_airport == destination:
+            # job done we've found our destination
+            routes.append(
+                (next_route, next_cost)
+            )
+        else:
+            # search for a deeper route
+            sub_routes = recursive_search(
+                next_route,
+                destination,
+                next_cost,
+                graph
+            )
+            for entry in sub_routes:
+                routes.append(entry)
+
+    return routes
 
 if __name__ == "__main__":
     import unittest
@@ -163,6 +1218,477 @@ if __name__ == "__main__":
                 find_cheapest_route("JFK", "LAX", 1),
                 (['JFK', 'LAX'], 500)
             )
+
+        def test_cheapest_atl_to_dfw_needs_two_connections(self):
+            self.assertEqual(
+                find_cheapest_route("ATL", "DFW", 2),
+                (['ATL', 'ORD', 'LAX', 'DFW'], 370)
+            )
+            with self.assertRaises(ValueError):
+                find_cheapest_route("ATL", "DFW", 1)
+
+        def test_cheapest_unknown_airport(self):
+            with self.assertRaises(ValueError):
+                find_cheapest_route("JFK", "XXX", 3)
+
+        def test_cheapest_path_respects_leg_budget(self):
+            # the cheap route needs more legs than the budget allows
+            graph = FlightGraph([
+                ('AAA', 'BBB', 1),
+                ('BBB', 'CCC', 1),
+                ('CCC', 'DDD', 1),
+                ('AAA', 'CCC', 5),
+                ('AAA', 'DDD', 20),
+            ])
+            self.assertEqual(
+                find_cheapest_route("AAA", "DDD", 2, graph),
+                (['AAA', 'BBB', 'CCC', 'DDD'], 3)
+            )
+            self.assertEqual(
+                find_cheapest_route("AAA", "DDD", 1, graph),
+                (['AAA', 'CCC', 'DDD'], 6)
+            )
+            self.assertEqual(
+                find_cheapest_route("AAA", "DDD", 0, graph),
+                (['AAA', 'DDD'], 20)
+            )
+
+        def test_iter_routes_is_lazy(self):
+            routes = iter_routes("JFK", "LAX", 2)
+            self.assertEqual(next(routes), (['JFK', 'ATL', 'ORD', 'LAX'], 440))
+            self.assertEqual(next(routes), (['JFK', 'LAX'], 500))
+            with self.assertRaises(StopIteration):
+                next(routes)
+
+        def test_iter_routes_parallel_flights(self):
+            # two airlines fly the same pair at different prices
+            graph = FlightGraph([
+                ('AAA', 'BBB', 10),
+                ('AAA', 'BBB', 15),
+                ('BBB', 'CCC', 10),
+                ('AAA', 'CCC', 22),
+            ])
+            self.assertEqual(
+                list(iter_routes("AAA", "CCC", 1, graph)),
+                [
+                    (['AAA', 'BBB', 'CCC'], 20),
+                    (['AAA', 'CCC'], 22),
+                    (['AAA', 'BBB', 'CCC'], 25)
+                ]
+            )
+
+        def test_flight_graph_departures(self):
+            graph = FlightGraph(CONNECTIONS)
+            self.assertEqual(
+                graph.departures("JFK"),
+                [
+                    ('ATL', 150),
+                    ('HKG', 800),
+                    ('LAX', 500)
+                ]
+            )
+            self.assertEqual(graph.departures("SFO"), [])
+            self.assertEqual(graph.departures("XXX"), [])
+
+        def test_flight_graph_float_prices(self):
+            graph = FlightGraph([
+                ('AAA', 'BBB', 10),
+                ('AAA', 'CCC', 12.5),
+            ])
+            self.assertEqual(
+                graph.departures("AAA"),
+                [
+                    ('BBB', 10.0),
+                    ('CCC', 12.5)
+                ]
+            )
+
+        def test_load_fares(self):
+            import io
+            fares = io.StringIO(
+                "source,destination,price\n"
+                "JFK,ATL,150\n"
+                "ATL,ORD,90\n"
+                "\n"
+                "ORD,LAX,200\n"
+                "JFK,LAX,500\n"
+            )
+            graph = load_fares(fares)
+            self.assertEqual(graph.leg_count(), 4)
+            self.assertEqual(
+                find_routes("JFK", "LAX", 2, graph),
+                [
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 440),
+                    (['JFK', 'LAX'], 500)
+                ]
+            )
+
+        def test_load_fares_bad_price(self):
+            import io
+            fares = io.StringIO(
+                "JFK\tATL\t150\n"
+                "ATL\tORD\tcheap\n"
+            )
+            with self.assertRaises(ValueError):
+                load_fares(fares, "\t")
+
+        def test_save_and_load_graph(self):
+            import os
+            import tempfile
+            (handle, path) = tempfile.mkstemp(suffix=".graph")
+            os.close(handle)
+            try:
+                save_graph(FlightGraph(CONNECTIONS), path)
+                graph = load_graph(path)
+                self.assertEqual(len(graph), 7)
+                self.assertEqual(graph.leg_count(), 7)
+                self.assertEqual(
+                    find_routes("JFK", "LAX", 2, graph),
+                    [
+                        (['JFK', 'ATL', 'ORD', 'LAX'], 440),
+                        (['JFK', 'LAX'], 500)
+                    ]
+                )
+                # a loaded graph can itself be saved again
+                save_graph(graph, path + ".copy")
+                self.assertEqual(
+                    load_graph(path + ".copy").departures("JFK"),
+                    graph.departures("JFK")
+                )
+            finally:
+                for name in (path, path + ".copy"):
+                    if os.path.exists(name):
+                        os.remove(name)
+
+        def test_load_graph_rejects_other_files(self):
+            import os
+            import tempfile
+            (handle, path) = tempfile.mkstemp()
+            os.write(handle, b"JFK,ATL,150\n" * 10)
+            os.close(handle)
+            try:
+                with self.assertRaises(ValueError):
+                    load_graph(path)
+            finally:
+                os.remove(path)
+
+        def test_load_graph_rejects_truncated_files(self):
+            import os
+            import tempfile
+            (handle, path) = tempfile.mkstemp(suffix=".graph")
+            os.close(handle)
+            try:
+                save_graph(FlightGraph(CONNECTIONS), path)
+                size = os.path.getsize(path)
+                for cut in (1, 20, size // 2):
+                    with open(path, "r+b") as snapshot:
+                        snapshot.truncate(size - cut)
+                    with self.assertRaises(ValueError):
+                        load_graph(path)
+                    save_graph(FlightGraph(CONNECTIONS), path)
+            finally:
+                os.remove(path)
+
+        def test_cost_table(self):
+            table = CostTable(FlightGraph(CONNECTIONS), "JFK", 2)
+            self.assertEqual(
+                table.route("LAX"),
+                (['JFK', 'ATL', 'ORD', 'LAX'], 440)
+            )
+            self.assertEqual(
+                table.route("LAX", 1),
+                (['JFK', 'LAX'], 500)
+            )
+            self.assertEqual(
+                table.route("DFW"),
+                (['JFK', 'LAX', 'DFW'], 580)
+            )
+            self.assertEqual(
+                table.route("DFW", 0),
+                None
+            )
+            # the cheaper four leg route is beyond the table's limit
+            self.assertEqual(
+                table.route("DFW", 3),
+                (['JFK', 'LAX', 'DFW'], 580)
+            )
+            self.assertEqual(table.route("XXX"), None)
+
+        def test_batch_keeps_query_order(self):
+            queries = [
+                ("JFK", "LAX", 2),
+                ("ATL", "DFW", 2),
+                ("JFK", "LAX", 1),
+                ("ATL", "DFW", 1),
+                ("SFO", "JFK", 5),
+            ]
+            expected = [
+                (['JFK', 'ATL', 'ORD', 'LAX'], 440),
+                (['ATL', 'ORD', 'LAX', 'DFW'], 370),
+                (['JFK', 'LAX'], 500),
+                None,
+                None
+            ]
+            self.assertEqual(find_cheapest_routes_batch(queries), expected)
+            self.assertEqual(
+                find_cheapest_routes_batch(queries, workers=2),
+                expected
+            )
+
+        def test_route_cache(self):
+            cache = RouteCache()
+            graph = FlightGraph(CONNECTIONS)
+            for _ in range(3):
+                self.assertEqual(
+                    find_cheapest_route("JFK", "LAX", 2, graph, cache),
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 440)
+                )
+                self.assertEqual(
+                    find_routes("JFK", "LAX", 0, graph, cache),
+                    [
+                        (['JFK', 'LAX'], 500)
+                    ]
+                )
+                with self.assertRaises(ValueError):
+                    find_cheapest_route("ATL", "DFW", 1, graph, cache)
+            self.assertEqual(cache.misses, 3)
+            self.assertEqual(cache.hits, 6)
+
+        def test_route_cache_eviction_and_expiry(self):
+            now = [0]
+            cache = RouteCache(maxsize=2, ttl=10, clock=lambda: now[0])
+            cache.put("a", 1)
+            cache.put("b", 2)
+            self.assertEqual(cache.get("a"), (True, 1))
+            # "b" is now the least recently used
+            cache.put("c", 3)
+            self.assertEqual(cache.get("b"), (False, None))
+            self.assertEqual(cache.get("c"), (True, 3))
+            now[0] = 10
+            self.assertEqual(cache.get("a"), (False, None))
+            self.assertEqual(len(cache), 1)
+
+        def test_route_cache_replaced_connections(self):
+            global CONNECTIONS
+            cache = RouteCache()
+            original = CONNECTIONS
+            try:
+                self.assertEqual(
+                    find_cheapest_route("JFK", "LAX", 0, cache=cache),
+                    (['JFK', 'LAX'], 500)
+                )
+                CONNECTIONS = (('JFK', 'LAX', 300),)
+                self.assertEqual(
+                    find_cheapest_route("JFK", "LAX", 0, cache=cache),
+                    (['JFK', 'LAX'], 300)
+                )
+            finally:
+                CONNECTIONS = original
+
+        def test_fare_changes(self):
+            graph = FlightGraph(CONNECTIONS)
+            version = graph.version()
+            graph.update_price("ORD", "LAX", 400)
+            self.assertNotEqual(graph.version(), version)
+            self.assertEqual(
+                find_cheapest_route("JFK", "LAX", 2, graph),
+                (['JFK', 'LAX'], 500)
+            )
+            graph.remove_leg("JFK", "LAX")
+            self.assertEqual(
+                find_cheapest_route("JFK", "LAX", 2, graph),
+                (['JFK', 'ATL', 'ORD', 'LAX'], 640)
+            )
+            graph.add_leg("JFK", "SEA", 100)
+            graph.add_leg("SEA", "LAX", 99.5)
+            self.assertEqual(
+                find_routes("JFK", "LAX", 2, graph),
+                [
+                    (['JFK', 'SEA', 'LAX'], 199.5),
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 640)
+                ]
+            )
+            self.assertEqual(graph.leg_count(), 8)
+            with self.assertRaises(ValueError):
+                graph.add_leg("JFK", "SEA", 50)
+            with self.assertRaises(ValueError):
+                graph.remove_leg("JFK", "LAX")
+            with self.assertRaises(ValueError):
+                graph.update_price("LAX", "JFK", 50)
+
+            graph.compact()
+            self.assertEqual(graph.leg_count(), 8)
+            self.assertEqual(
+                graph.departures("JFK"),
+                [
+                    ('ATL', 150),
+                    ('HKG', 800),
+                    ('SEA', 100.0)
+                ]
+            )
+
+        def test_fare_changes_to_a_mapped_graph(self):
+            import os
+            import pickle
+            import tempfile
+            (handle, path) = tempfile.mkstemp(suffix=".graph")
+            os.close(handle)
+            try:
+                save_graph(FlightGraph(CONNECTIONS), path)
+                graph = load_graph(path)
+                graph.update_price("ATL", "ORD", 10)
+                self.assertEqual(
+                    find_cheapest_route("JFK", "LAX", 2, graph),
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 360)
+                )
+                # a changed graph is pickled with its changes
+                self.assertEqual(
+                    pickle.loads(pickle.dumps(graph)).departures("ATL"),
+                    [
+                        ('SFO', 400),
+                        ('ORD', 10)
+                    ]
+                )
+                save_graph(graph, path + ".copy")
+                self.assertEqual(
+                    load_graph(path + ".copy").departures("ATL"),
+                    [
+                        ('SFO', 400),
+                        ('ORD', 10)
+                    ]
+                )
+            finally:
+                for name in (path, path + ".copy"):
+                    if os.path.exists(name):
+                        os.remove(name)
+
+        def test_cost_table_refresh(self):
+            graph = FlightGraph(CONNECTIONS)
+            table = CostTable(graph, "JFK", 2)
+            # flying on to ORD from SFO is never the cheaper way there
+            graph.add_leg("SFO", "ORD", 500)
+            self.assertFalse(table.refresh())
+            self.assertEqual(
+                table.route("ORD"),
+                (['JFK', 'ATL', 'ORD'], 240)
+            )
+            # the cheapest route to LAX uses this flight
+            graph.update_price("ORD", "LAX", 300)
+            self.assertTrue(table.refresh())
+            self.assertEqual(
+                table.route("LAX"),
+                (['JFK', 'LAX'], 500)
+            )
+            # a new cheaper flight is picked up without an explicit refresh
+            graph.add_leg("ATL", "LAX", 10)
+            self.assertEqual(
+                table.route("LAX"),
+                (['JFK', 'ATL', 'LAX'], 160)
+            )
+
+        def test_cost_table_behind_the_change_log(self):
+            graph = FlightGraph(CONNECTIONS)
+            table = CostTable(graph, "JFK", 2)
+            for price in range(3 * _CHANGE_LOG_SIZE):
+                graph.update_price("JFK", "HKG", 1000 + price)
+            self.assertLessEqual(len(graph._changed), 2 * _CHANGE_LOG_SIZE)
+            graph.update_price("ORD", "LAX", 10)
+            self.assertTrue(table.refresh())
+            self.assertEqual(
+                table.route("LAX"),
+                (['JFK', 'ATL', 'ORD', 'LAX'], 250)
+            )
+            graph.compact()
+            self.assertEqual(graph._changed, [])
+            self.assertEqual(table.route("HKG"), (['JFK', 'HKG'], 999 + 3 * _CHANGE_LOG_SIZE))
+
+        def test_route_cache_fare_change(self):
+            cache = RouteCache()
+            graph = FlightGraph(CONNECTIONS)
+            self.assertEqual(
+                find_cheapest_route("JFK", "LAX", 0, graph, cache),
+                (['JFK', 'LAX'], 500)
+            )
+            graph.update_price("JFK", "LAX", 450)
+            self.assertEqual(
+                find_cheapest_route("JFK", "LAX", 0, graph, cache),
+                (['JFK', 'LAX'], 450)
+            )
+
+        def test_branch_and_bound_search(self):
+            self.assertEqual(
+                branch_and_bound_search("JFK", "LAX", 2),
+                [
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 440),
+                    (['JFK', 'LAX'], 500)
+                ]
+            )
+            self.assertEqual(
+                branch_and_bound_search("JFK", "LAX", 1),
+                [
+                    (['JFK', 'LAX'], 500)
+                ]
+            )
+            self.assertEqual(
+                branch_and_bound_search("JFK", "LAX", 2, max_cost=450),
+                [
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 440)
+                ]
+            )
+            self.assertEqual(
+                branch_and_bound_search("ATL", "JFK", 5),
+                []
+            )
+
+        def test_branch_and_bound_cheapest_only(self):
+            graph = FlightGraph([
+                ('AAA', 'BBB', 50),
+                ('AAA', 'CCC', 10),
+                ('BBB', 'DDD', 10),
+                ('CCC', 'BBB', 10),
+                ('CCC', 'DDD', 60),
+                ('BBB', 'CCC', 1),
+            ])
+            self.assertEqual(
+                branch_and_bound_search("AAA", "DDD", 3, graph, cheapest_only=True),
+                [
+                    (['AAA', 'CCC', 'BBB', 'DDD'], 30)
+                ]
+            )
+            self.assertEqual(
+                branch_and_bound_search("AAA", "DDD", 0, graph, cheapest_only=True),
+                []
+            )
+
+        def test_branch_and_bound_remembers_bounds(self):
+            graph = FlightGraph(CONNECTIONS)
+            lax = graph.airport_id("LAX")
+            bounds = _bounds_to(graph, lax)
+            self.assertIs(_bounds_to(graph, lax), bounds)
+            # a fare change makes the bounds out of date
+            graph.update_price("ORD", "LAX", 10)
+            self.assertEqual(_bounds_to(graph, lax)[0][graph.airport_id("JFK")], 250)
+            self.assertEqual(
+                branch_and_bound_search("JFK", "LAX", 2, graph, cheapest_only=True),
+                [
+                    (['JFK', 'ATL', 'ORD', 'LAX'], 250)
+                ]
+            )
+
+        def test_find_routes_with_graph(self):
+            graph = FlightGraph([
+                ('AAA', 'BBB', 10),
+                ('BBB', 'CCC', 10),
+                ('AAA', 'CCC', 30),
+                ('CCC', 'AAA', 5),
+            ])
+            self.assertEqual(
+                find_routes("AAA", "CCC", 1, graph),
+                [
+                    (['AAA', 'BBB', 'CCC'], 20),
+                    (['AAA', 'CCC'], 30)
+                ]
+            )
             
 
     # run the tests
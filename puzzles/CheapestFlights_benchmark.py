@@ -0,0 +1,265 @@
+"""
+Benchmarks for the CheapestFlights module.
+
+Builds reproducible hub-and-spoke fare networks of increasing size and
+times each search mode over a set of random queries, reporting latency
+percentiles, throughput and peak memory as JSON.
+
+$ python CheapestFlights_benchmark.py --sizes 200:2000 1000:20000 --connections 1 2 3
+"""
+import argparse
+import itertools
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+import CheapestFlights
+
+
+def airport_code(index):
+    """
+    Returns a three (or more) letter airport code for an integer
+    e.g. 0 -> AAA, 1 -> AAB, ...
+    """
+    letters = []
+    while True:
+        (index, letter) = divmod(index, 26)
+        letters.append(string.ascii_uppercase[letter])
+        if not index and len(letters) >= 3:
+            break
+    return "".join(reversed(letters))
+
+
+def generate_network(airports, legs, hubs=None, hub_share=0.8,
+                     price_median=150, price_sigma=0.5, seed=0):
+    """
+    Returns a list of connections in the form
+    [
+        (SOURCE, DESTINATION, PRICE),
+        ...
+    ]
+    for a hub-and-spoke network.
+
+    airports     - the number of airports
+    legs         - the number of direct flights
+    hubs         - the number of hub airports, defaults to ~sqrt(airports)
+    hub_share    - the fraction of flights that start or end at a hub
+    price_median - the median leg price
+    price_sigma  - the spread of the log-normal leg prices
+    seed         - the random seed, the same seed gives the same network
+
+    Every airport has at least one flight to and from a hub so that the
+    network is connected, the remaining flights are drawn at random.
+
+    RAISES
+        ValueError
+        - when there are fewer than two airports (and legs are wanted)
+    """
+    if airports < 2 and legs > 0:
+        raise ValueError("a network of %d airport(s) has no flights" % (airports))
+    rng = random.Random(seed)
+    if hubs is None:
+        hubs = max(1, int(airports ** 0.5))
+    hubs = min(hubs, airports)
+    codes = [airport_code(i) for i in range(airports)]
+
+    def price():
+        return int(round(price_median * rng.lognormvariate(0, price_sigma)))
+
+    def hub():
+        return rng.randrange(hubs)
+
+    connections = []
+    for spoke in range(hubs, airports):
+        if len(connections) + 2 > legs:
+            break
+        connections.append((codes[spoke], codes[hub()], price()))
+        connections.append((codes[hub()], codes[spoke], price()))
+    while len(connections) < legs:
+        source = rng.randrange(airports)
+        destination = rng.randrange(airports)
+        if rng.random() < hub_share:
+            if rng.random() < 0.5:
+                source = hub()
+            else:
+                destination = hub()
+        if source != destination:
+            connections.append((codes[source], codes[destination], price()))
+    return connections
+
+
+def generate_queries(connections, count, seed=0):
+    """
+    Returns count random (SOURCE, DESTINATION) pairs of airports that
+    have departures and arrivals respectively
+    """
+    rng = random.Random(seed)
+    sources = sorted(set(connection[0] for connection in connections))
+    destinations = sorted(set(connection[1] for connection in connections))
+    queries = []
+    while len(queries) < count:
+        pair = (rng.choice(sources), rng.choice(destinations))
+        if pair[0] != pair[1]:
+            queries.append(pair)
+    return queries
+
+
+def _cheapest(graph, source, destination, max_connections):
+    try:
+        return CheapestFlights.find_cheapest_route(
+            source, destination, max_connections, graph
+        )
+    except ValueError:
+        return None
+
+
+def _cheapest_five(graph, source, destination, max_connections):
+    return list(
+        itertools.islice(
+            CheapestFlights.iter_routes(source, destination, max_connections, graph),
+            5
+        )
+    )
+
+
+def _branch_and_bound(graph, source, destination, max_connections):
+    return CheapestFlights.branch_and_bound_search(
+        source, destination, max_connections, graph, cheapest_only=True
+    )
+
+
+def _cost_table(graph, source, destination, max_connections):
+    return CheapestFlights.CostTable(
+        graph, source, max_connections
+    ).route(destination)
+
+
+MODES = {
+    "dijkstra": _cheapest,
+    "yen_top5": _cheapest_five,
+    "branch_and_bound": _branch_and_bound,
+    "cost_table": _cost_table,
+}
+
+
+def percentile(ordered, fraction):
+    """
+    Returns the value at the given fraction (0..1) of a sorted list
+    """
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_queries(query, graph, queries, max_connections):
+    """
+    Times each query, returning the latency statistics in milliseconds
+    """
+    latencies = []
+    started = time.perf_counter()
+    for (source, destination) in queries:
+        before = time.perf_counter()
+        query(graph, source, destination, max_connections)
+        latencies.append((time.perf_counter() - before) * 1000)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "queries": len(queries),
+        "p50_ms": percentile(latencies, 0.5),
+        "p90_ms": percentile(latencies, 0.9),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else None,
+        "queries_per_second": len(queries) / elapsed if elapsed else None,
+    }
+
+
+def peak_memory(query, graph, queries, max_connections):
+    """
+    Returns the peak memory in bytes allocated while running the queries
+    """
+    tracemalloc.start()
+    try:
+        for (source, destination) in queries:
+            query(graph, source, destination, max_connections)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, connections, modes, queries=100, seed=0):
+    """
+    Benchmarks every mode against every network size and connection
+    limit, returning a list of result dictionaries
+        sizes       - a list of (AIRPORTS, LEGS)
+        connections - a list of max_connections values
+        modes       - names from MODES
+    """
+    results = []
+    for (airports, legs) in sizes:
+        network = generate_network(airports, legs, seed=seed)
+        started = time.perf_counter()
+        graph = CheapestFlights.FlightGraph(network)
+        build_ms = (time.perf_counter() - started) * 1000
+        pairs = generate_queries(network, queries, seed=seed)
+        for max_connections in connections:
+            for mode in modes:
+                query = MODES[mode]
+                result = {
+                    "mode": mode,
+                    "airports": airports,
+                    "legs": legs,
+                    "max_connections": max_connections,
+                    "seed": seed,
+                    "build_ms": build_ms,
+                }
+                result.update(time_queries(query, graph, pairs, max_connections))
+                result["peak_bytes"] = peak_memory(
+                    query, graph, pairs[:max(1, len(pairs) // 10)], max_connections
+                )
+                results.append(result)
+    return results
+
+
+def _size(text):
+    (airports, legs) = text.split(":")
+    if int(airports) < 2:
+        raise argparse.ArgumentTypeError("%s has fewer than two airports" % (text))
+    return (int(airports), int(legs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", nargs="+", type=_size, default=[(100, 1000), (1000, 10000)],
+        metavar="AIRPORTS:LEGS", help="network sizes to benchmark"
+    )
+    parser.add_argument(
+        "--connections", nargs="+", type=int, default=[1, 2],
+        help="max_connections values to benchmark"
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=sorted(MODES), default=sorted(MODES),
+        help="search modes to benchmark"
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", help="write the JSON results to a file instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.connections, args.modes, args.queries, args.seed)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,21 @@ he must learn in order to satisfy all customers.
 For the input above, the answer would be 2, as drinks 1 and 5
 will satisfy everyone.
 """
+import contextlib
+import csv
+import heapq
+import sys
+import time
+from array import array
 
-def required_drinks(preferences):
+try:
+    import numpy
+except ImportError:
+    # the "numpy" backend is optional
+    numpy = None
+
+
+def required_drinks(preferences, backend="lazy"):
     """
     This function takes a dictionary of personal preferences in the form
     {
@@ -35,19 +48,926 @@ def required_drinks(preferences):
         (DRINK_1, [PERSON_1, PERSON_2, ...]),
         ...
     ]
+    Each round picks the most popular drink (see most_popular_drink) among
+    the customers who are still unsatisfied.
+
+    backend - how the rounds are run, every backend gives the same answer
+        "lazy"   - see lazy_cover (the default)
+        "bitset" - see bitset_cover
+        "numpy"  - see numpy_cover (needs numpy to be installed)
+
+    RAISES
+        ValueError
+        - when a customer has no favourite drinks
+        - when the backend is unknown
+        ImportError
+        - when the numpy backend is asked for without numpy
+    """
+    if backend == "bitset":
+        stats = _STATS
+        if stats is None:
+            return bitset_cover(DrinkIndex(preferences))
+        started = time.perf_counter()
+        index = DrinkIndex(preferences)
+        stats.record_inversion(time.perf_counter() - started, len(index.customers))
+        return bitset_cover(index)
+    if backend == "lazy":
+        return lazy_cover(preferences)
+    if backend == "numpy":
+        return numpy_cover(preferences)
+    raise ValueError("unknown backend %s" % (backend))
+
+class DrinkStats:
+    """
+    The statistics gathered while profiling (see profiling) is switched on.
+        inversions - a dictionary per inverted index built
+            {"seconds": ..., "drinks": NUMBER_OF_DRINKS}
+        rounds     - a dictionary per greedy round
+            {
+                "ranking_seconds": TIME_TO_FIND_THE_MOST_POPULAR_DRINK,
+                "deletion_seconds": TIME_TO_REMOVE_SATISFIED_CUSTOMERS,
+                "customers_remaining": ...,
+                "drinks_considered": ...,
+                "allocated_blocks": CHANGE_IN_ALLOCATED_MEMORY_BLOCKS
+            }
+    """
+    def __init__(self, callback=None):
+        self._callback = callback
+        self.inversions = []
+        self.rounds = []
+
+    def record_inversion(self, seconds, drinks):
+        self.inversions.append({"seconds": seconds, "drinks": drinks})
+
+    def record_round(self, ranking_seconds, deletion_seconds,
+                     customers_remaining, drinks_considered, allocated_blocks):
+        record = {
+            "ranking_seconds": ranking_seconds,
+            "deletion_seconds": deletion_seconds,
+            "customers_remaining": customers_remaining,
+            "drinks_considered": drinks_considered,
+            "allocated_blocks": allocated_blocks,
+        }
+        self.rounds.append(record)
+        if self._callback is not None:
+            self._callback(record)
+
+    def totals(self):
+        """
+        Returns the statistics summed over every inversion and round
+        """
+        return {
+            "inversion_seconds": sum(i["seconds"] for i in self.inversions),
+            "ranking_seconds": sum(r["ranking_seconds"] for r in self.rounds),
+            "deletion_seconds": sum(r["deletion_seconds"] for r in self.rounds),
+            "rounds": len(self.rounds),
+            "drinks_considered": sum(r["drinks_considered"] for r in self.rounds),
+            "allocated_blocks": sum(r["allocated_blocks"] for r in self.rounds),
+        }
+
+    def as_dict(self):
+        """
+        Returns every statistic as plain data, e.g. for json.dumps
+        """
+        return {
+            "totals": self.totals(),
+            "inversions": list(self.inversions),
+            "rounds": list(self.rounds),
+        }
+
+_STATS = None
+
+@contextlib.contextmanager
+def profiling(callback=None):
     """
-    # take a working copy
-    outstanding_preferences = dict(preferences)
+    A context manager that records where required_drinks spends its time
+        with PopularDrinks.profiling() as stats:
+            PopularDrinks.required_drinks(preferences)
+        print(stats.totals())
+
+    callback - an optional function called with each round's dictionary
+               as soon as the round is complete
+
+    When profiling is off each round only pays for a check of a local
+    variable.
+    """
+    global _STATS
+    previous = _STATS
+    _STATS = DrinkStats(callback)
+    try:
+        yield _STATS
+    finally:
+        _STATS = previous
+
+def _allocated_blocks():
+    # CPython only, other interpreters report no allocations
+    return getattr(sys, "getallocatedblocks", lambda: 0)()
+
+def bitset_cover(index, allowed=None):
+    """
+    This function takes a DrinkIndex and greedily picks drinks until every
+    customer is satisfied, returning them in the same form as
+    required_drinks.
+
+    allowed - an optional collection of the only drinks that may be picked
+
+    The unsatisfied customers are a bitmask, so the popularity of a drink
+    is a single AND and popcount of two integers. As in lazy_cover, the
+    drinks are kept in a heap ordered by their ranking when they were
+    last counted, and only the drink at the top is counted again each
+    time, rather than every drink every round.
+    """
+    def ranking(drink, customers):
+        # a min heap, so the most popular drink has the lowest ranking
+        (bit, position) = index.first_mention(drink, customers)
+        return (-_weighting(drink, _popcount(customers)), bit, position, drink, customers)
+
+    outstanding = index.everyone()
+    heap = [
+        ranking(drink, customers)
+        for (drink, customers) in index.customers.items()
+        if allowed is None or drink in allowed
+    ]
+    heapq.heapify(heap)
     drinks = []
-    while(outstanding_preferences):
-        drink = most_popular_drink(outstanding_preferences)
-        drinks.append(drink)
+    stats = _STATS
+    if stats is not None:
+        started = time.perf_counter()
+        blocks = _allocated_blocks()
+        considered = 0
+    while outstanding:
+        if not heap:
+            raise ValueError(
+                "no drink for customer(s) %s" % (index.members(outstanding))
+            )
+        entry = heapq.heappop(heap)
+        if stats is not None:
+            considered += 1
+        customers = entry[-1] & outstanding
+        if not customers:
+            # this drink can't satisfy anyone else
+            continue
+        if customers != entry[-1]:
+            current = ranking(entry[3], customers)
+            if heap and heap[0] < current:
+                # it has become less popular than another drink might be
+                heapq.heappush(heap, current)
+                continue
+
+        if stats is not None:
+            ranked = time.perf_counter()
+        drinks.append((entry[3], index.members(customers)))
+        # now remove any satisfied customers
+        outstanding &= ~customers
+        if stats is not None:
+            finished = time.perf_counter()
+            stats.record_round(
+                ranked - started,
+                finished - ranked,
+                _popcount(outstanding),
+                considered,
+                _allocated_blocks() - blocks
+            )
+            (started, blocks, considered) = (finished, _allocated_blocks(), 0)
+    return drinks
+
+def numpy_cover(preferences):
+    """
+    This function takes a dictionary of personal preferences and greedily
+    picks drinks in the same way, and with the same result, as
+    required_drinks, using numpy arrays.
+
+    The preferences become a customer x drink incidence matrix in CSR
+    form (one row of drink columns per customer, in sorted order). The
+    popularity of every drink is a vectorised column sum, and satisfying
+    customers subtracts the column counts of their rows.
+
+    RAISES
+        ImportError
+        - when numpy is not installed
+    """
+    if numpy is None:
+        raise ImportError("the numpy backend needs numpy to be installed")
+
+    inverting = time.perf_counter()
+    people = sorted(preferences.keys())
+    columns = {}
+    row_starts = [0]
+    entries = []
+    for person in people:
+        for drink in preferences[person]:
+            if not drink in columns:
+                columns[drink] = len(columns)
+            entries.append(columns[drink])
+        row_starts.append(len(entries))
+    drinks = list(columns)
+    values = numpy.array(drinks)
+    indptr = numpy.array(row_starts, dtype=numpy.int64)
+    indices = numpy.array(entries, dtype=numpy.int64)
+    # the customer rows of each drink column, in ascending row order
+    rows_of = numpy.repeat(numpy.arange(len(people)), numpy.diff(indptr))
+    order = numpy.argsort(indices, kind="stable")
+    column_rows = rows_of[order]
+    column_starts = numpy.searchsorted(indices[order], numpy.arange(len(drinks) + 1))
+
+    popularity = numpy.bincount(indices, minlength=len(drinks))
+    outstanding = numpy.ones(len(people), dtype=bool)
+    stats = _STATS
+    if stats is not None:
+        stats.record_inversion(time.perf_counter() - inverting, len(drinks))
+
+    def customers(column):
+        rows = column_rows[column_starts[column]:column_starts[column + 1]]
+        return numpy.unique(rows[outstanding[rows]])
+
+    def first_mention(column):
+        row = customers(column)[0]
+        row_drinks = indices[indptr[row]:indptr[row + 1]]
+        return (row, int(numpy.flatnonzero(row_drinks == column)[0]))
+
+    result = []
+    while outstanding.any():
+        if stats is not None:
+            started = time.perf_counter()
+            blocks = _allocated_blocks()
+        candidates = numpy.flatnonzero(popularity > 0)
+        if not len(candidates):
+            raise ValueError(
+                "no drink for customer(s) %s"
+                % ([people[row] for row in numpy.flatnonzero(outstanding)])
+            )
+        weightings = _weighting(values[candidates], popularity[candidates])
+        ties = candidates[weightings == weightings.max()]
+        column = ties[0]
+        if len(ties) > 1:
+            column = min(ties, key=first_mention)
+
+        if stats is not None:
+            ranked = time.perf_counter()
+        rows = customers(column)
+        result.append((drinks[column], [people[row] for row in rows]))
         # now remove any satisfied customers
-        for person in drink[1]:
-            del outstanding_preferences[person]
+        outstanding[rows] = False
+        starts = indptr[rows]
+        lengths = indptr[rows + 1] - starts
+        positions = (
+            numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+            + numpy.arange(lengths.sum())
+        )
+        popularity -= numpy.bincount(indices[positions], minlength=len(drinks))
+        if stats is not None:
+            stats.record_round(
+                ranked - started,
+                time.perf_counter() - ranked,
+                int(outstanding.sum()),
+                len(candidates),
+                _allocated_blocks() - blocks
+            )
+    return result
+
+def required_drinks_batch(venues, workers=None, backend="lazy"):
+    """
+    This function takes a list of preference dictionaries, one per venue,
+    and returns a list of their required_drinks, in the same order.
+
+    workers - the number of processes to spread the venues over, by
+              default every venue is solved in this process
+    backend - passed on to required_drinks
+    """
+    jobs = [(preferences, backend) for preferences in venues]
+    if workers is None or workers <= 1:
+        return [_solve(job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_solve, jobs))
+
+def _solve(job):
+    (preferences, backend) = job
+    return required_drinks(preferences, backend)
+
+def required_drinks_by_component(preferences, workers=None, backend="lazy"):
+    """
+    This function takes a dictionary of personal preferences and returns
+    the same drinks as required_drinks, having split the customers into
+    groups that share no drinks (see split_preferences) and solved each
+    group on its own, in parallel if workers is given.
+
+    A drink picked in one group never changes the popularity of a drink
+    in another, so each group's picks are exactly the picks the whole
+    greedy pass would make for it. Merging the groups' answers by
+    popularity (and then first customer, as most_popular_drink does)
+    gives the same order too.
+    """
+    groups = split_preferences(preferences)
+    answers = required_drinks_batch(groups, workers, backend)
+    return list(
+        heapq.merge(
+            *answers,
+            key=lambda drink: (-drink_popularity_weighting(drink), drink[1][0])
+        )
+    )
+
+def split_preferences(preferences):
+    """
+    This function takes a dictionary of personal preferences and splits
+    it into a list of dictionaries in the same form, such that no two
+    dictionaries have a drink in common. The groups are found by
+    union-find over drinks that are liked by the same person.
+    """
+    parent = {}
+
+    def root(drink):
+        parent.setdefault(drink, drink)
+        while parent[drink] != drink:
+            # path halving
+            parent[drink] = parent[parent[drink]]
+            drink = parent[drink]
+        return drink
+
+    for drinks in preferences.values():
+        if drinks:
+            first = root(drinks[0])
+            for drink in drinks[1:]:
+                other = root(drink)
+                if other != first:
+                    parent[other] = first
+
+    groups = {}
+    loners = []
+    for (person, drinks) in preferences.items():
+        if not drinks:
+            # keep them so that solving their group reports them
+            loners.append({person: drinks})
+            continue
+        groups.setdefault(root(drinks[0]), {})[person] = drinks
+    return list(groups.values()) + loners
+
+class DrinkMenu:
+    """
+    The drinks the bartender knows, kept valid as customers come, go and
+    change their minds, without re-solving from scratch.
+
+    It starts from required_drinks(preferences) and keeps:
+        _fans       - {DRINK: {PERSON, ...}}, as drinks_from_preferences
+        _satisfiers - {PERSON: NUMBER_OF_MENU_DRINKS_THEY_LIKE}
+        _only_drink - {MENU_DRINK: NUMBER_OF_PEOPLE_IT_ALONE_SATISFIES}
+    A customer who isn't satisfied gets their most popular drink added,
+    and a menu drink that no longer alone satisfies anybody is dropped.
+    An event costs O(the customer's drinks), plus O(a drink's fans) for
+    each drink added to or dropped from the menu.
+    """
+    def __init__(self, preferences=None):
+        preferences = preferences or {}
+        self._preferences = {}
+        self._fans = {}
+        for (drink, people) in drinks_from_preferences(preferences).items():
+            self._fans[drink] = set(people)
+        for (person, drinks) in preferences.items():
+            self._preferences[person] = list(dict.fromkeys(drinks))
+        self._menu = set()
+        self._satisfiers = dict.fromkeys(preferences, 0)
+        self._only_drink = {}
+        for (drink, _) in required_drinks(preferences):
+            self._learn(drink)
+
+    def __len__(self):
+        return len(self._menu)
+
+    def __contains__(self, drink):
+        return drink in self._menu
+
+    def drinks(self):
+        """
+        Returns the sorted list of drinks on the menu
+        """
+        return sorted(self._menu)
+
+    def required_drinks(self):
+        """
+        Returns the menu in the same form as required_drinks
+        """
+        return bitset_cover(DrinkIndex(self._preferences), self._menu)
+
+    def add_customer(self, person, drinks):
+        """
+        Adds a customer and their favourite drinks
+
+        RAISES
+            ValueError
+            - when the customer is already known or has no favourites
+        """
+        if person in self._preferences:
+            raise ValueError("customer %s already exists" % (person))
+        if not drinks:
+            raise ValueError("customer %s has no favourite drinks" % (person))
+        drinks = list(dict.fromkeys(drinks))
+        self._preferences[person] = drinks
+        self._satisfiers[person] = 0
+        for drink in drinks:
+            if not drink in self._fans:
+                self._fans[drink] = set()
+            self._fans[drink].add(person)
+            if drink in self._menu:
+                self._satisfy(person, drink)
+        if not self._satisfiers[person]:
+            self._learn(max(
+                drinks,
+                key=lambda drink: _weighting(drink, len(self._fans[drink]))
+            ))
+
+    def remove_customer(self, person):
+        """
+        Removes a customer, dropping any drinks only they needed
+
+        RAISES
+            ValueError
+            - when the customer is unknown
+        """
+        if not person in self._preferences:
+            raise ValueError("unknown customer %s" % (person))
+        drinks = self._preferences.pop(person)
+        if self._satisfiers.pop(person) == 1:
+            self._only_drink[self._menu_drink(drinks)] -= 1
+        for drink in drinks:
+            self._fans[drink].discard(person)
+        self._drop_redundant(drinks)
+        for drink in drinks:
+            if not self._fans[drink] and not drink in self._menu:
+                del self._fans[drink]
+
+    def update_customer(self, person, drinks):
+        """
+        Changes the favourite drinks of a customer
+
+        RAISES
+            ValueError
+            - when the customer is unknown or has no favourites, in which
+              case the menu is left unchanged
+        """
+        if not person in self._preferences:
+            raise ValueError("unknown customer %s" % (person))
+        if not drinks:
+            raise ValueError("customer %s has no favourite drinks" % (person))
+        self.remove_customer(person)
+        self.add_customer(person, drinks)
+
+    def _menu_drink(self, drinks):
+        for drink in drinks:
+            if drink in self._menu:
+                return drink
+
+    def _satisfy(self, person, drink):
+        # drink has just become one of the menu drinks person likes
+        self._satisfiers[person] += 1
+        count = self._satisfiers[person]
+        if count == 1:
+            self._only_drink[drink] += 1
+        elif count == 2:
+            # whichever drink satisfied them before no longer does it alone
+            for other in self._preferences[person]:
+                if other != drink and other in self._menu:
+                    self._only_drink[other] -= 1
+                    break
+
+    def _learn(self, drink):
+        self._menu.add(drink)
+        self._only_drink[drink] = 0
+        for person in self._fans[drink]:
+            self._satisfy(person, drink)
+        self._drop_redundant(
+            other for person in self._fans[drink]
+            for other in self._preferences[person]
+            if other != drink
+        )
+
+    def _forget(self, drink):
+        self._menu.remove(drink)
+        del self._only_drink[drink]
+        for person in self._fans[drink]:
+            self._satisfiers[person] -= 1
+            if self._satisfiers[person] == 1:
+                self._only_drink[self._menu_drink(self._preferences[person])] += 1
+
+    def _drop_redundant(self, drinks):
+        # least popular first, so the most popular drinks are kept
+        for drink in sorted(
+            set(drink for drink in drinks if drink in self._menu),
+            key=lambda drink: _weighting(drink, len(self._fans[drink]))
+        ):
+            if drink in self._menu and not self._only_drink[drink]:
+                self._forget(drink)
+
+def required_drinks_from_rows(rows):
+    """
+    This function takes the preferences as a stream of rows rather than a
+    dictionary, and returns the same drinks as required_drinks would for
+    the equivalent dictionary.
+
+    rows - an iterable of (PERSON, DRINK) pairs, or the name of (or an
+           open) CSV file with a PERSON,DRINK row per preference.
+           A person's rows needn't be together, but their drinks are
+           taken to be in the order their rows appear.
+
+    The rows are read once, straight into compact per-drink arrays of
+    people, so only one copy of the preferences is ever held. The cover
+    is then a lazy greedy pass over those arrays: the drink at the top
+    of a heap is recounted when it is popped and only picked if it is
+    still the most popular.
+    """
+    if isinstance(rows, str):
+        with open(rows, newline="") as csv_file:
+            return required_drinks_from_rows(csv_file)
+    if hasattr(rows, "read"):
+        rows = _read_preference_rows(rows)
+
+    people = []
+    person_ids = {}
+    # positions are unsigned 32 bit, like the "i" person ids
+    mentions = array("I")
+    # fans[DRINK] = PERSON_IDS, places[DRINK] = where it is in their list
+    fans = {}
+    places = {}
+    for (person, drink) in rows:
+        person_id = person_ids.get(person)
+        if person_id is None:
+            person_id = len(people)
+            person_ids[person] = person_id
+            people.append(person)
+            mentions.append(0)
+        if not drink in fans:
+            fans[drink] = array("i")
+            places[drink] = array("I")
+        fans[drink].append(person_id)
+        places[drink].append(mentions[person_id])
+        mentions[person_id] += 1
+    del person_ids, mentions
+
+    # the position of each person in sorted order
+    rank = array("i", bytes(4 * len(people)))
+    for (position, person_id) in enumerate(
+        sorted(range(len(people)), key=people.__getitem__)
+    ):
+        rank[person_id] = position
+    satisfied = bytearray(len(people))
+
+    def ranking(drink):
+        count = 0
+        first = None
+        for (i, person_id) in enumerate(fans[drink]):
+            if not satisfied[person_id]:
+                count += 1
+                if first is None or rank[person_id] < rank[first]:
+                    first = person_id
+                    place = places[drink][i]
+        if first is None:
+            return None
+        return (-_weighting(drink, count), rank[first], place, drink)
+
+    heap = [ranking(drink) for drink in fans]
+    heapq.heapify(heap)
+    drinks = []
+    unsatisfied = len(people)
+    while heap:
+        entry = heapq.heappop(heap)
+        current = ranking(entry[-1])
+        if current is None:
+            continue
+        if current != entry and heap and heap[0] < current:
+            heapq.heappush(heap, current)
+            continue
+
+        chosen = []
+        for person_id in fans[entry[-1]]:
+            if not satisfied[person_id]:
+                satisfied[person_id] = 1
+                chosen.append(person_id)
+        chosen.sort(key=rank.__getitem__)
+        drinks.append((entry[-1], [people[person_id] for person_id in chosen]))
+        unsatisfied -= len(chosen)
+        if not unsatisfied:
+            break
+    return drinks
+
+def _read_preference_rows(csv_file):
+    for (line, row) in enumerate(csv.reader(csv_file)):
+        if not row:
+            continue
+        (person, drink) = (_parse_field(field) for field in row)
+        if line == 0 and isinstance(drink, str):
+            # a header row
+            continue
+        yield (person, drink)
+
+def _parse_field(text):
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+def exact_required_drinks(preferences, time_limit=None):
+    """
+    This function takes a dictionary of personal preferences and returns
+    the fewest drinks that satisfy every customer, in the same form as
+    required_drinks.
+
+    time_limit - an optional number of seconds after which the best
+                 answer found so far is returned
+
+    The greedy answer from lazy_cover is the starting point. The
+    problem is then reduced:
+    - a drink liked by a subset of the people who like another drink is
+      never needed
+    - a drink that is some customer's only option must be learnt
+    and the rest is a branch-and-bound search. It branches on the
+    unsatisfied customer with the fewest options, and it prunes with a
+    lower bound: the number of unsatisfied customers who share no drinks
+    with each other.
+
+    RAISES
+        ValueError
+        - when a customer has no favourite drinks
+    """
+    deadline = None
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+
+    def out_of_time():
+        return deadline is not None and time.monotonic() > deadline
+
+    greedy = lazy_cover(preferences)
+    best = [drink for (drink, _) in greedy]
+    if out_of_time():
+        return greedy
+    index = DrinkIndex(preferences)
+    (drinks, customers) = _undominated_drinks(index)
+    if out_of_time():
+        return greedy
+    # options[PERSON_BIT] = bitmask of the indexes into drinks they like
+    liked_by = [[] for _ in index.people]
+    for (i, liked) in enumerate(customers):
+        for bit in _bits(liked):
+            liked_by[bit].append(i)
+    options = [_bitmask(liked) if liked else 0 for liked in liked_by]
+    if out_of_time():
+        return greedy
+
+    chosen = []
+    outstanding = index.everyone()
+    for bit in range(len(options)):
+        only = options[bit]
+        if outstanding >> bit & 1 and not only & (only - 1):
+            # this customer's only option
+            i = only.bit_length() - 1
+            chosen.append(i)
+            outstanding &= ~customers[i]
+
+    def lower_bound(outstanding):
+        # customers with no drink in common each need a different drink
+        needed = 0
+        taken = 0
+        for bit in sorted(_bits(outstanding), key=lambda b: _popcount(options[b])):
+            if not options[bit] & taken:
+                needed += 1
+                taken |= options[bit]
+        return needed
 
+    def branches(outstanding):
+        # branch on the customer with the fewest options
+        bit = min(_bits(outstanding), key=lambda b: _popcount(options[b]))
+        return iter(sorted(
+            _bits(options[bit]),
+            key=lambda i: -_popcount(customers[i] & outstanding)
+        ))
+
+    def search(outstanding, chosen):
+        # depth first, keeping (OUTSTANDING, DEPTH, UNTRIED_DRINKS) for
+        # each open choice on a list rather than the python stack
+        stack = []
+        while True:
+            if not outstanding:
+                if len(chosen) < len(best):
+                    best[:] = [drinks[i] for i in chosen]
+            elif len(chosen) + lower_bound(outstanding) < len(best):
+                if out_of_time():
+                    return
+                stack.append((outstanding, len(chosen), branches(outstanding)))
+            # move on to the next untried drink, backing up when a
+            # choice has none left
+            while stack:
+                (parent, depth, untried) = stack[-1]
+                i = next(untried, None)
+                if i is not None:
+                    break
+                stack.pop()
+            else:
+                return
+            del chosen[depth:]
+            chosen.append(i)
+            outstanding = parent & ~customers[i]
+
+    if not out_of_time():
+        search(outstanding, chosen)
+    if len(best) == len(greedy):
+        return greedy
+    # list the chosen drinks the same way required_drinks does
+    return bitset_cover(index, set(best))
+
+def _undominated_drinks(index):
+    """
+    Returns ([DRINK_1, ...], [BITMASK_1, ...]) for the drinks of a
+    DrinkIndex that aren't liked by a subset of another drink's fans.
+    Of drinks with exactly the same fans only the most popular is kept.
+    """
+    by_customers = {}
+    for (drink, customers) in index.customers.items():
+        kept = by_customers.get(customers)
+        if kept is None or _weighting(drink, 0) > _weighting(kept, 0):
+            by_customers[customers] = drink
+
+    # a drink can only be dominated by a drink its first customer likes
+    liked_by = {}
+    for customers in by_customers:
+        for bit in _bits(customers):
+            liked_by.setdefault(bit, []).append(customers)
+    drinks = []
+    masks = []
+    for (customers, drink) in by_customers.items():
+        first = (customers & -customers).bit_length() - 1
+        if not any(
+            other != customers and not customers & ~other
+            for other in liked_by[first]
+        ):
+            drinks.append(drink)
+            masks.append(customers)
+    return (drinks, masks)
+
+def _bits(mask):
+    """
+    Yields the positions of the set bits of an integer, lowest first
+    """
+    # searching the binary digits is much faster than repeatedly
+    # clearing the lowest bit of a large integer
+    digits = bin(mask)[:1:-1]
+    bit = digits.find("1")
+    while bit >= 0:
+        yield bit
+        bit = digits.find("1", bit + 1)
+
+def lazy_cover(preferences):
+    """
+    This function takes a dictionary of personal preferences and greedily
+    picks drinks in the same way, and with the same result, as
+    required_drinks, without re-ranking every drink each round.
+
+    The drinks are kept in a heap ordered by their weighting when they
+    were last looked at. A drink's weighting can only fall as customers
+    are satisfied, so when the drink at the top is still as popular as
+    it was it must be the most popular; otherwise it is re-ranked and
+    pushed back. Satisfying a customer only updates the counts of the
+    drinks they like, so the whole cover costs roughly
+    O(TOTAL_PREFERENCES * log(DRINKS)).
+    """
+    stats = _STATS
+    if stats is not None:
+        started = time.perf_counter()
+    fans = drinks_from_preferences(preferences)
+    if stats is not None:
+        stats.record_inversion(time.perf_counter() - started, len(fans))
+    popularity = dict((drink, len(people)) for (drink, people) in fans.items())
+    # fans[DRINK][first[DRINK]:] holds everyone who may still want it
+    first = dict.fromkeys(fans, 0)
+    satisfied = set()
+
+    def ranking(drink):
+        people = fans[drink]
+        start = first[drink]
+        while people[start] in satisfied:
+            start += 1
+        first[drink] = start
+        person = people[start]
+        # a min heap, so the most popular drink has the lowest ranking
+        return (
+            -_weighting(drink, popularity[drink]),
+            person,
+            preferences[person].index(drink),
+            drink
+        )
+
+    heap = [ranking(drink) for drink in fans]
+    heapq.heapify(heap)
+    drinks = []
+    if stats is not None:
+        started = time.perf_counter()
+        blocks = _allocated_blocks()
+        considered = 0
+    while len(satisfied) < len(preferences):
+        if not heap:
+            raise ValueError(
+                "no drink for customer(s) %s"
+                % (sorted(set(preferences) - satisfied))
+            )
+        entry = heapq.heappop(heap)
+        drink = entry[-1]
+        if stats is not None:
+            considered += 1
+        if not popularity[drink]:
+            continue
+        current = ranking(drink)
+        if current != entry and heap and heap[0] < current:
+            # it has become less popular than another drink might be
+            heapq.heappush(heap, current)
+            continue
+
+        if stats is not None:
+            ranked = time.perf_counter()
+        people = []
+        for person in fans[drink][first[drink]:]:
+            if person in satisfied:
+                continue
+            satisfied.add(person)
+            people.append(person)
+            for liked in preferences[person]:
+                popularity[liked] -= 1
+        drinks.append((drink, people))
+        if stats is not None:
+            finished = time.perf_counter()
+            stats.record_round(
+                ranked - started,
+                finished - ranked,
+                len(preferences) - len(satisfied),
+                considered,
+                _allocated_blocks() - blocks
+            )
+            (started, blocks, considered) = (finished, _allocated_blocks(), 0)
     return drinks
 
+class DrinkIndex:
+    """
+    The inverse of a dictionary of personal preferences, built once, in
+    which the people who like each drink are held as the bits of an
+    integer.
+        people    - every person, in bit order (sorted)
+        customers - {DRINK_1: BITMASK_1, ...} with drinks in the same
+                    order as drinks_from_preferences lists them
+    """
+    def __init__(self, preferences):
+        self._preferences = preferences
+        self.people = sorted(preferences.keys())
+        bits = {}
+        for (bit, person) in enumerate(self.people):
+            for drink in preferences[person]:
+                if not drink in bits:
+                    bits[drink] = []
+                bits[drink].append(bit)
+        self.customers = dict(
+            (drink, _bitmask(drink_bits)) for (drink, drink_bits) in bits.items()
+        )
+
+    def everyone(self):
+        """
+        Returns the bitmask of every person
+        """
+        return (1 << len(self.people)) - 1
+
+    def members(self, customers):
+        """
+        Returns the (sorted) list of people in a bitmask
+        """
+        people = []
+        while customers:
+            lowest = customers & -customers
+            people.append(self.people[lowest.bit_length() - 1])
+            customers ^= lowest
+        return people
+
+    def first_mention(self, drink, customers):
+        """
+        Returns (PERSON_BIT, POSITION) for the first of the customers to
+        name a drink and where it comes in their list. This is the order
+        that drinks_from_preferences(...) lists drinks in, which decides
+        between drinks of equal popularity.
+        """
+        bit = (customers & -customers).bit_length() - 1
+        return (bit, self._preferences[self.people[bit]].index(drink))
+
+def _bitmask(bits):
+    """
+    Returns an integer with the given (ascending) bits set
+    """
+    mask = bytearray(bits[-1] // 8 + 1)
+    for bit in bits:
+        mask[bit >> 3] |= 1 << (bit & 7)
+    return int.from_bytes(mask, "little")
+
+if hasattr(int, "bit_count"):
+    # python 3.10+
+    _popcount = int.bit_count
+else:
+    def _popcount(value):
+        return bin(value).count("1")
+
 def most_popular_drink(preferences):
     """
     This function takes a dictionary of personal preferences in the form
@@ -79,7 +999,10 @@ def drink_popularity_weighting(drink_details):
     have the same number of people. This means will will always
     get a repeatable result.
     """
-    return len(drink_details[1]) * 100 + drink_details[0]
+    return _weighting(drink_details[0], len(drink_details[1]))
+
+def _weighting(drink, people):
+    return people * 100 + drink
 
 def drinks_from_preferences(preferences):
     """
@@ -121,6 +1044,20 @@ if __name__ == "__main__":
                 4: [5, 8]
             }
 
+        def _random_preferences(self, seed, favourites=6, bars=1):
+            # up to 40 people, each liking up to favourites drinks from
+            # one of a number of bars that share no drinks
+            import random
+            rng = random.Random(seed)
+            preferences = {}
+            for person in rng.sample(range(100), rng.randint(1, 40)):
+                bar = rng.randrange(bars) * 1000
+                preferences[person] = [
+                    bar + drink
+                    for drink in rng.sample(range(rng.choice([10, 300])), rng.randint(1, favourites))
+                ]
+            return preferences
+
         def test_drinks_from_preferences(self):
             self.assertEqual(
                 drinks_from_preferences(self._preferences),
@@ -178,5 +1115,326 @@ if __name__ == "__main__":
                 ]
             )
 
+        def test_required_drinks_matches_repeated_most_popular_drink(self):
+            import random
+            for seed in range(50):
+                rng = random.Random(seed)
+                preferences = {}
+                for person in range(rng.randint(1, 30)):
+                    preferences[person] = rng.sample(
+                        range(rng.choice([10, 300])), rng.randint(1, 5)
+                    )
+                # the original approach, re-ranking everything each round
+                outstanding = dict(preferences)
+                expected = []
+                while outstanding:
+                    drink = most_popular_drink(outstanding)
+                    expected.append(drink)
+                    for person in drink[1]:
+                        del outstanding[person]
+                self.assertEqual(required_drinks(preferences), expected)
+
+        def test_required_drinks_no_favourites(self):
+            with self.assertRaises(ValueError):
+                required_drinks({0: [1], 1: []})
+            with self.assertRaises(ValueError):
+                required_drinks({0: [1], 1: []}, backend="lazy")
+
+        def test_required_drinks_unknown_backend(self):
+            with self.assertRaises(ValueError):
+                required_drinks(self._preferences, backend="guess")
+
+        def test_lazy_backend_matches_bitset(self):
+            self.assertEqual(
+                required_drinks(self._preferences, backend="lazy"),
+                [
+                    (5, [2, 3, 4]),
+                    (1, [0, 1])
+                ]
+            )
+            for seed in range(200):
+                preferences = self._random_preferences(seed)
+                self.assertEqual(
+                    required_drinks(preferences, backend="lazy"),
+                    required_drinks(preferences, backend="bitset")
+                )
+
+        def test_drink_index(self):
+            index = DrinkIndex(self._preferences)
+            self.assertEqual(index.people, [0, 1, 2, 3, 4])
+            self.assertEqual(index.customers[5], 0b11100)
+            self.assertEqual(index.members(index.customers[1]), [0, 1])
+            self.assertEqual(list(index.customers), [0, 1, 3, 6, 4, 7, 2, 5, 8])
+
+        @unittest.skipIf(numpy is None, "numpy is not installed")
+        def test_numpy_backend_matches_bitset(self):
+            self.assertEqual(
+                required_drinks(self._preferences, backend="numpy"),
+                [
+                    (5, [2, 3, 4]),
+                    (1, [0, 1])
+                ]
+            )
+            for seed in range(200):
+                preferences = self._random_preferences(seed)
+                self.assertEqual(
+                    required_drinks(preferences, backend="numpy"),
+                    required_drinks(preferences, backend="bitset")
+                )
+            with self.assertRaises(ValueError):
+                required_drinks({0: [1], 1: []}, backend="numpy")
+
+        def test_required_drinks_from_rows(self):
+            import io
+            rows = io.StringIO(
+                "person,drink\n"
+                + "".join(
+                    "%d,%d\n" % (person, drink)
+                    for (person, drinks) in self._preferences.items()
+                    for drink in drinks
+                )
+            )
+            self.assertEqual(
+                required_drinks_from_rows(rows),
+                [
+                    (5, [2, 3, 4]),
+                    (1, [0, 1])
+                ]
+            )
+            for seed in range(200):
+                preferences = self._random_preferences(seed)
+                rows = [
+                    (person, drink)
+                    for (person, drinks) in preferences.items()
+                    for drink in drinks
+                ]
+                # people's rows needn't be together, only in order
+                rows.sort(key=lambda row: preferences[row[0]].index(row[1]))
+                self.assertEqual(
+                    required_drinks_from_rows(iter(rows)),
+                    required_drinks(preferences)
+                )
+
+        def test_required_drinks_from_rows_long_lists(self):
+            # more favourites than fit in 16 bits
+            rows = [(0, drink) for drink in range(70000)] + [(1, 69999)]
+            self.assertEqual(
+                required_drinks_from_rows(iter(rows)),
+                [
+                    (69999, [0, 1])
+                ]
+            )
+
+        def test_split_preferences(self):
+            preferences = {
+                0: [1, 2],
+                1: [3],
+                2: [2, 4],
+                3: [5, 3],
+                4: [6]
+            }
+            self.assertEqual(
+                split_preferences(preferences),
+                [
+                    {0: [1, 2], 2: [2, 4]},
+                    {1: [3], 3: [5, 3]},
+                    {4: [6]}
+                ]
+            )
+
+        def test_required_drinks_batch(self):
+            venues = [
+                self._preferences,
+                {0: [1], 1: [2]},
+                {}
+            ]
+            expected = [
+                [
+                    (5, [2, 3, 4]),
+                    (1, [0, 1])
+                ],
+                [
+                    (2, [1]),
+                    (1, [0])
+                ],
+                []
+            ]
+            self.assertEqual(required_drinks_batch(venues), expected)
+            self.assertEqual(required_drinks_batch(venues, workers=2), expected)
+
+        def test_required_drinks_by_component(self):
+            for seed in range(100):
+                # a few separate bars' worth of drinks
+                preferences = self._random_preferences(seed, favourites=4, bars=4)
+                self.assertEqual(
+                    required_drinks_by_component(preferences),
+                    required_drinks(preferences)
+                )
+            self.assertEqual(
+                required_drinks_by_component(self._preferences, workers=2),
+                required_drinks(self._preferences)
+            )
+
+        def test_drink_menu(self):
+            menu = DrinkMenu(self._preferences)
+            self.assertEqual(menu.drinks(), [1, 5])
+            # already satisfied by drink 5
+            menu.add_customer(5, [5, 9])
+            self.assertEqual(menu.drinks(), [1, 5])
+            # nothing on the menu will do, drink 9 is the more popular
+            menu.add_customer(6, [9, 10])
+            self.assertEqual(menu.drinks(), [1, 5, 9])
+            # customer 5 still has drink 5, so drink 9 is no longer needed
+            menu.update_customer(6, [10])
+            self.assertEqual(menu.drinks(), [1, 5, 10])
+            menu.remove_customer(0)
+            menu.remove_customer(1)
+            self.assertEqual(menu.drinks(), [5, 10])
+            self.assertEqual(
+                menu.required_drinks(),
+                [
+                    (5, [2, 3, 4, 5]),
+                    (10, [6])
+                ]
+            )
+            with self.assertRaises(ValueError):
+                menu.remove_customer(0)
+            with self.assertRaises(ValueError):
+                menu.add_customer(2, [1])
+            with self.assertRaises(ValueError):
+                menu.add_customer(7, [])
+
+        def test_drink_menu_failed_update(self):
+            menu = DrinkMenu({0: [1], 1: [2]})
+            with self.assertRaises(ValueError):
+                menu.update_customer(0, [])
+            with self.assertRaises(ValueError):
+                menu.update_customer(2, [3])
+            # nothing has changed
+            self.assertEqual(menu.drinks(), [1, 2])
+            self.assertEqual(
+                menu.required_drinks(),
+                [
+                    (2, [1]),
+                    (1, [0])
+                ]
+            )
+
+        def test_drink_menu_stays_a_cover(self):
+            import random
+            rng = random.Random(0)
+            preferences = {}
+            menu = DrinkMenu()
+            for _ in range(500):
+                person = rng.randrange(30)
+                drinks = rng.sample(range(15), rng.randint(1, 3))
+                if person in preferences and rng.random() < 0.5:
+                    menu.remove_customer(person)
+                    del preferences[person]
+                elif person in preferences:
+                    menu.update_customer(person, drinks)
+                    preferences[person] = drinks
+                else:
+                    menu.add_customer(person, drinks)
+                    preferences[person] = drinks
+                on_menu = set(menu.drinks())
+                # everyone is satisfied
+                for liked in preferences.values():
+                    self.assertTrue(on_menu & set(liked))
+                # and every drink is the only one for somebody
+                for drink in on_menu:
+                    self.assertTrue(any(
+                        on_menu & set(liked) == {drink}
+                        for liked in preferences.values()
+                    ))
+
+        def test_profiling(self):
+            for backend in ("bitset", "lazy", "numpy"):
+                if backend == "numpy" and numpy is None:
+                    continue
+                seen = []
+                with profiling(seen.append) as stats:
+                    drinks = required_drinks(self._preferences, backend)
+                self.assertEqual(len(stats.inversions), 1)
+                self.assertEqual(stats.inversions[0]["drinks"], 9)
+                self.assertEqual(len(stats.rounds), len(drinks))
+                self.assertEqual(seen, stats.rounds)
+                self.assertEqual(
+                    [r["customers_remaining"] for r in stats.rounds],
+                    [2, 0]
+                )
+                totals = stats.as_dict()["totals"]
+                self.assertEqual(totals["rounds"], 2)
+                self.assertTrue(totals["drinks_considered"] >= 2)
+            # nothing is recorded once profiling is over
+            required_drinks(self._preferences)
+            self.assertEqual(len(stats.rounds), 2)
+
+        def test_exact_required_drinks(self):
+            self.assertEqual(
+                exact_required_drinks(self._preferences),
+                [
+                    (5, [2, 3, 4]),
+                    (1, [0, 1])
+                ]
+            )
+
+        def test_exact_beats_greedy(self):
+            # drink 3 is the most popular but both other drinks are needed
+            preferences = {
+                0: [1, 3],
+                1: [1, 3],
+                2: [1],
+                3: [2, 3],
+                4: [2, 3],
+                5: [2]
+            }
+            self.assertEqual(len(required_drinks(preferences)), 3)
+            self.assertEqual(
+                exact_required_drinks(preferences),
+                [
+                    (2, [3, 4, 5]),
+                    (1, [0, 1, 2])
+                ]
+            )
+
+        def test_exact_matches_brute_force(self):
+            import itertools
+            import random
+            for seed in range(100):
+                rng = random.Random(seed)
+                preferences = {}
+                for person in range(rng.randint(1, 12)):
+                    preferences[person] = rng.sample(range(8), rng.randint(1, 3))
+                drinks = sorted(set(d for liked in preferences.values() for d in liked))
+                fewest = next(
+                    size for size in range(1, len(drinks) + 1)
+                    if any(
+                        all(set(liked) & set(menu) for liked in preferences.values())
+                        for menu in itertools.combinations(drinks, size)
+                    )
+                )
+                found = exact_required_drinks(preferences)
+                self.assertEqual(len(found), fewest)
+                self.assertEqual(
+                    sorted(p for (_, people) in found for p in people),
+                    sorted(preferences)
+                )
+
+        def test_exact_time_limit(self):
+            # with no time to search the greedy answer is returned
+            preferences = {
+                0: [1, 3],
+                1: [1, 3, 4],
+                2: [1, 4],
+                3: [2, 3],
+                4: [2, 3, 4],
+                5: [2, 4]
+            }
+            self.assertEqual(
+                exact_required_drinks(preferences, time_limit=-1),
+                required_drinks(preferences)
+            )
+
     # run the tests
     unittest.main(verbosity=2)
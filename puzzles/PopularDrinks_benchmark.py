@@ -0,0 +1,110 @@
+"""
+Benchmarks for the PopularDrinks module.
+
+Builds reproducible bar instances of increasing size and runs each
+required_drinks backend over them with profiling switched on, reporting
+the time spent inverting, ranking and deleting as JSON.
+
+$ python PopularDrinks_benchmark.py --sizes 1000:100 10000:1000 --backends bitset lazy
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import PopularDrinks
+
+
+def generate_preferences(customers, drinks, favourites=(1, 5), skew=1.0, seed=0):
+    """
+    Returns a dictionary of personal preferences in the form
+    {
+        PERSON_1: [DRINK_1, DRINK_2, ...],
+        ...
+    }
+    customers  - the number of customers
+    drinks     - the number of different drinks
+    favourites - the (smallest, largest) number of favourites a customer has
+    skew       - how much more popular the first drinks are than the last,
+                 drink N is liked in proportion to 1 / (N + 1) ** skew
+    seed       - the random seed, the same seed gives the same preferences
+    """
+    rng = random.Random(seed)
+    weights = [1 / (drink + 1) ** skew for drink in range(drinks)]
+    preferences = {}
+    for person in range(customers):
+        wanted = min(drinks, rng.randint(*favourites))
+        liked = []
+        while len(liked) < wanted:
+            drink = rng.choices(range(drinks), weights)[0]
+            if not drink in liked:
+                liked.append(drink)
+        preferences[person] = liked
+    return preferences
+
+
+def run(sizes, backends, seed=0, skew=1.0):
+    """
+    Runs every backend against every instance size, returning a list of
+    result dictionaries
+        sizes    - a list of (CUSTOMERS, DRINKS)
+        backends - names of required_drinks backends
+    """
+    results = []
+    for (customers, drinks) in sizes:
+        preferences = generate_preferences(customers, drinks, skew=skew, seed=seed)
+        for backend in backends:
+            with PopularDrinks.profiling() as stats:
+                started = time.perf_counter()
+                answer = PopularDrinks.required_drinks(preferences, backend)
+                seconds = time.perf_counter() - started
+            result = {
+                "backend": backend,
+                "customers": customers,
+                "drinks": drinks,
+                "seed": seed,
+                "seconds": seconds,
+                "required_drinks": len(answer),
+            }
+            result.update(stats.totals())
+            results.append(result)
+    return results
+
+
+def _size(text):
+    (customers, drinks) = text.split(":")
+    return (int(customers), int(drinks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", nargs="+", type=_size, default=[(1000, 100), (10000, 1000)],
+        metavar="CUSTOMERS:DRINKS", help="instance sizes to benchmark"
+    )
+    backends = ["bitset", "lazy"]
+    if PopularDrinks.numpy is not None:
+        backends.append("numpy")
+    parser.add_argument(
+        "--backends", nargs="+", choices=["bitset", "lazy", "numpy"],
+        default=backends, help="required_drinks backends to benchmark"
+    )
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", help="write the JSON results to a file instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.backends, args.seed, args.skew)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,16 @@
 """
  This is an example program which uses the roman2 module.
+
+ Run it with no arguments to convert values interactively, or with --bulk
+ to convert every whitespace separated value in a file (or stdin):
+
+ $ python example.py --bulk values.txt --workers 4 > converted.txt
 """
+import argparse
+import sys
+
+import roman
+
 # python 2 compatability
 try:
     input = raw_input
@@ -25,9 +35,89 @@ def isDecimal(value):
         return False
 
 
-def main():
-    import roman
+def convert(values):
+    """
+    Convert a list of decimal and/or numeral strings.
+
+    values - the strings to convert
+
+    returns string
+        - a "VALUE --> RESULT" or "*** ERROR" line for each value
+    """
+    decimals = []
+    numerals = []
+    for value in values:
+        if isDecimal(value):
+            decimals.append(int(value))
+        else:
+            numerals.append(value)
+    fromDecimals = iter(zip(*roman.asNumeralsMany(decimals)))
+    fromNumerals = iter(zip(*roman.asDecimalMany(numerals)))
+
+    lines = []
+    for value in values:
+        if isDecimal(value):
+            (result, error) = next(fromDecimals)
+        else:
+            (result, error) = next(fromNumerals)
+        if error is None:
+            lines.append("%s --> %s\n" % (value, result))
+        else:
+            lines.append("*** %s\n" % (error))
+    return "".join(lines)
+
+
+def readValues(stream, chunkSize):
+    """
+    Read whitespace separated values from a stream in large chunks.
+
+    stream    - the file to read
+    chunkSize - the number of characters to read at a time
 
+    yields a list of the values in each chunk
+    """
+    partial = ""
+    while True:
+        text = stream.read(chunkSize)
+        if not text:
+            break
+        text = partial + text
+        values = text.split()
+        partial = ""
+        if values and not text[-1].isspace():
+            # the last value may carry on into the next chunk
+            partial = values.pop()
+        if values:
+            yield values
+    if partial:
+        yield [partial]
+
+
+def bulk(stream, output, workers=1, chunkSize=1 << 20):
+    """
+    Convert every value in a stream, writing the results to output.
+
+    stream    - the file to read values from
+    output    - the file to write results to
+    workers   - the number of processes to convert chunks in
+    chunkSize - the number of characters to read at a time
+    """
+    chunks = readValues(stream, chunkSize)
+    if workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            for text in pool.imap(convert, chunks):
+                output.write(text)
+        finally:
+            pool.terminate()
+    else:
+        for values in chunks:
+            output.write(convert(values))
+    output.flush()
+
+
+def interactive():
     print("Enter space separated values to convert to/from roman numerals.\n'q' to quit")
     while True:
         for value in input("\nDecimals and/or numerals to convert: ").split():
@@ -45,4 +135,32 @@ def main():
                 print("*** %s" % (error))
 
 
-main()
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert values to/from roman numerals."
+    )
+    parser.add_argument(
+        "--bulk", nargs="?", const="-", metavar="FILE",
+        help="convert every value in FILE (default stdin) without prompting"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="the number of processes to use with --bulk"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1 << 20,
+        help="the number of characters to read at a time with --bulk"
+    )
+    args = parser.parse_args(argv)
+
+    if args.bulk is None:
+        interactive()
+    elif args.bulk == "-":
+        bulk(sys.stdin, sys.stdout, args.workers, args.chunk_size)
+    else:
+        with open(args.bulk) as stream:
+            bulk(stream, sys.stdout, args.workers, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,24 @@
  >>> roman.asNumerals(2063)
  "MMLXIII"
  >>>
+
+ Conversions can be traced and counted, e.g. to log every conversion and
+ export how many failed:
+
+ >>> roman.logTrace()
+ >>> roman.enableStats()
+ >>> roman.getStats()
+ {'calls': 0, 'failures': {...}, 'seconds': 0.0}
 """
+import functools
+import logging
+import time
+
+try:
+    import numpy
+except ImportError:
+    # asNumeralsMany is vectorised when numpy is available
+    numpy = None
 
 _VALUES = {
     'I':     1,
@@ -35,28 +52,173 @@ _VALUES = {
     'M':  1000,
 }
 
-_NUMERALS_ORDERED_BY_STRING_LENGTH = sorted(
-    _VALUES.keys(),
-    key=lambda k: len(k),
-    reverse=True
-)
-
 _VALUES_ORDERED_BY_SIZE = sorted(
     _VALUES.items(),
     key=lambda item: item[1],
     reverse=True
 )
 
+# _LONGER[(NUMERAL, CHARACTER)] is the numeral made by adding the
+# character, e.g. _LONGER[('C', 'M')] == 'CM'. Every prefix of a numeral
+# is itself a numeral, so following this from a single character finds
+# the longest numeral at that point of a string.
+_LONGER = dict(
+    ((numeral[:-1], numeral[-1]), numeral)
+    for numeral in _VALUES
+    if len(numeral) > 1
+)
+
+
+def _largestFirst(value):
+    # the numerals for a value, taking the largest numeral each time
+    numerals = []
+    while(value):
+        for (numeral, v) in _VALUES_ORDERED_BY_SIZE:
+            if v <= value:
+                numerals.append(numeral)
+                value -= v
+                break
+    return "".join(numerals)
+
+
+# _DIGITS[0] is the numerals for 0-9, _DIGITS[1] for 0, 10-90 and
+# _DIGITS[2] for 0, 100-900; thousands are as many 'M's as are needed
+_DIGITS = [
+    [_largestFirst(digit * 10 ** power) for digit in range(10)]
+    for power in range(3)
+]
+
+
+def _decode(string):
+    total = 0
+    previous = None
+    length = len(string)
+    start = 0
+    while start < length:
+        # split off the next roman digit
+        numeral = string[start]
+        if numeral not in _VALUES:
+            raise ValueError("unrecognised numeral %s[%s]" % (string[:start], string[start:]))
+        end = start + 1
+        while end < length:
+            longer = _LONGER.get((numeral, string[end]))
+            if longer is None:
+                break
+            numeral = longer
+            end += 1
+
+        # get the decimal value of this numeral
+        value = _VALUES[numeral]
+
+        if previous is not None:
+            # cannot have a value greater than the previous one
+            if value > _VALUES[previous]:
+                raise ValueError("increasing value %s" % (_context(string, start, end)))
+
+            # cannot start the next numeral with the last
+            # character of the previous numeral unless it is 'M'
+            if numeral != 'M' and numeral[0] == previous[-1]:
+                raise ValueError("bad repetition %s" % (_context(string, start, end)))
+
+        total += value
+        previous = numeral
+        start = end
+
+    return total
+
+
+def _context(string, start, end):
+    return "%s[%s]%s" % (string[:start], string[start:end], string[end:])
+
+
+# the kinds of ValueError a conversion can fail with
+_FAILURES = (
+    'unrecognised numeral',
+    'increasing value',
+    'bad repetition',
+    'out of range',
+)
+
+# the trace callback, see setTrace
+_trace = None
+
+# the conversion counters, see enableStats
+_counting = False
+_stats = {
+    'calls': 0,
+    'failures': dict.fromkeys(_FAILURES, 0),
+    'seconds': 0.0,
+}
+
+
+def setTrace(callback):
+    """
+    Call a function with a message such as "asDecimal(XII)" every time a
+    conversion function is called.
+        callback - a function taking the message, or None to stop tracing
+    """
+    global _trace
+    _trace = callback
+
+
+def logTrace(logger=None, level=logging.DEBUG):
+    """
+    Trace conversions to a logger.
+        logger - the logging.Logger to use, defaults to the "roman" logger
+        level  - the level to log the messages at
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    setTrace(lambda message: logger.log(level, message))
+
+
+def enableStats(enabled=True):
+    """
+    Start (or stop) counting conversions, see getStats.
+        enabled - whether to count conversions
+    """
+    global _counting
+    _counting = enabled
+
 
-def _getNumeral(string):
-    for numeral in _NUMERALS_ORDERED_BY_STRING_LENGTH:
-        if string.startswith(numeral):
-            # remove the numeral from the string
-            newString = string.replace(numeral, '', 1)
-            return (numeral, newString)
+def getStats():
+    """
+    Get the conversion counters, collected while enableStats is on.
 
-    # didn't match a roman numeral!
-    raise ValueError()
+    RETURNS
+        {
+            'calls': NUMBER OF VALUES CONVERTED,
+            'failures': {KIND OF ValueError: NUMBER OF VALUES, ...},
+            'seconds': TOTAL TIME SPENT CONVERTING,
+        }
+    """
+    return {
+        'calls': _stats['calls'],
+        'failures': dict(_stats['failures']),
+        'seconds': _stats['seconds'],
+    }
+
+
+def resetStats():
+    """
+    Set the conversion counters back to zero.
+    """
+    _stats['calls'] = 0
+    _stats['failures'] = dict.fromkeys(_FAILURES, 0)
+    _stats['seconds'] = 0.0
+
+
+def _count(calls, errors, started):
+    _stats['calls'] += calls
+    _stats['seconds'] += time.perf_counter() - started
+    failures = _stats['failures']
+    for error in errors:
+        if error is not None:
+            message = str(error)
+            for kind in _FAILURES:
+                if message.startswith(kind):
+                    failures[kind] += 1
+                    break
 
 
 def asDecimal(string):
@@ -73,36 +235,18 @@ def asDecimal(string):
         - when invalid increasing numeral value
         - when invalid repetition of numerals
     """
-    print("asDecimal(%s)" % string)
-
-    numerals = []
-    values = []
-    while(string):
-        try:
-            # split off the next roman digit
-            (numeral, string) = _getNumeral(string)
-        except ValueError:
-            raise ValueError("unrecognised numeral %s[%s]" % (''.join(numerals), string))
-
-        # get the decimal value of this numeral
-        value = _VALUES[numeral]
-
-        # get the context in case of errors
-        context = "%s[%s]%s" % ("".join(numerals), numeral, string)
-
-        # cannot have a value greater than the previous one
-        if (values and (value > values[-1])):
-            raise ValueError("increasing value %s" % (context))
-
-        # cannot start the next numeral with the last
-        # character of the previous numeral unless it is 'M'
-        if (numerals and numeral != 'M' and (numeral[0] == numerals[-1][-1])):
-            raise ValueError("bad repetition %s" % (context))
-
-        values.append(value)
-        numerals.append(numeral)
-
-    return sum(values)
+    if _trace is not None:
+        _trace("asDecimal(%s)" % string)
+    if not _counting:
+        return _decode(string)
+    started = time.perf_counter()
+    try:
+        value = _decode(string)
+    except ValueError as error:
+        _count(1, [error], started)
+        raise
+    _count(1, [], started)
+    return value
 
 
 def asNumerals(value):
@@ -117,37 +261,229 @@ def asNumerals(value):
         ValueError
         - when value is out of range
     """
+    if _trace is not None:
+        _trace("asNumerals(%s)" % value)
+    if not _counting:
+        return _encode(value)
+    started = time.perf_counter()
+    try:
+        numerals = _encode(value)
+    except ValueError as error:
+        _count(1, [error], started)
+        raise
+    _count(1, [], started)
+    return numerals
+
+
+def _encode(value):
     if value < 1:
         raise ValueError("out of range %d" % (value))
-    numerals = []
-    while(value):
-        for (numeral, v) in _VALUES_ORDERED_BY_SIZE:
-            if v <= value:
-                numerals.append(numeral)
-                value -= v
-                break
-    return "".join(numerals)
+    (thousands, value) = divmod(value, 1000)
+    (hundreds, value) = divmod(value, 100)
+    (tens, units) = divmod(value, 10)
+    return (
+        'M' * thousands
+        + _DIGITS[2][hundreds]
+        + _DIGITS[1][tens]
+        + _DIGITS[0][units]
+    )
+
 
+def asNumeralsMany(values):
+    """
+    Convert a batch of integers into roman numerals.
+        values - an iterable of integers, or a numpy integer array
 
+    RETURNS
+        (NUMERALS, ERRORS) - two lists the length of values, for each
+        value either the numerals and None or None and the ValueError
+        (or TypeError, for a value that isn't an integer) that asNumerals
+        would have raised for it
+
+    Integer numpy arrays are converted without a python loop, by
+    splitting every value into its digits at once and gathering their
+    numerals from the same tables as asNumerals.
+    """
+    started = time.perf_counter()
+    if numpy is not None and isinstance(values, numpy.ndarray) and values.dtype.kind in "iu":
+        (numerals, errors) = _asNumeralsArray(values.ravel())
+    else:
+        numerals = []
+        errors = []
+        for value in values:
+            try:
+                numerals.append(_encode(value))
+                errors.append(None)
+            except (TypeError, ValueError) as error:
+                numerals.append(None)
+                errors.append(error)
+    if _trace is not None:
+        _trace("asNumeralsMany(%d values)" % len(numerals))
+    if _counting:
+        _count(len(numerals), errors, started)
+    return (numerals, errors)
+
+
+def _asNumeralsArray(values):
+    original = values
+    bad = values < 1
+    if values.dtype.kind == "u":
+        # these are out of range, rather than wrapping round when cast
+        bad |= values > numpy.iinfo(numpy.int64).max
+    values = numpy.where(bad, 1, values).astype(numpy.int64)
+    (thousands, rest) = numpy.divmod(values, 1000)
+    (hundreds, rest) = numpy.divmod(rest, 100)
+    (tens, units) = numpy.divmod(rest, 10)
+    digits = [numpy.array(table, dtype=object) for table in _DIGITS]
+    numerals = (
+        numpy.char.multiply('M', thousands).astype(object)
+        + digits[2][hundreds]
+        + digits[1][tens]
+        + digits[0][units]
+    ).tolist()
+    errors = [None] * len(numerals)
+    for index in numpy.flatnonzero(bad).tolist():
+        numerals[index] = None
+        errors[index] = ValueError("out of range %d" % (original[index]))
+    return (numerals, errors)
+
+
+def asDecimalMany(strings):
+    """
+    Convert a batch of roman numeral strings into decimal integers.
+        strings - an iterable of strings
+
+    RETURNS
+        (VALUES, ERRORS) - two lists the length of strings, for each
+        string either the value and None or None and the ValueError
+        that asDecimal would have raised for it (or a TypeError, for an
+        entry that isn't a string)
+
+    Each distinct string is only converted once.
+    """
+    started = time.perf_counter()
+    values = []
+    errors = []
+    converted = {}
+    for string in strings:
+        if not isinstance(string, str):
+            values.append(None)
+            errors.append(TypeError("not a string %r" % (string,)))
+            continue
+        result = converted.get(string)
+        if result is None:
+            try:
+                result = (_decode(string), None)
+            except ValueError as error:
+                result = (None, error)
+            converted[string] = result
+        values.append(result[0])
+        errors.append(result[1])
+    if _trace is not None:
+        _trace("asDecimalMany(%d strings)" % len(values))
+    if _counting:
+        _count(len(values), errors, started)
+    return (values, errors)
+
+
+# the values of Numeral that are interned, see Numeral.__new__
+_INTERNED_RANGE = range(1, 4000)
+_INTERNED = {}
+
+
+@functools.total_ordering
 class Numeral:
-    def __init__(self, value):
+    """
+    A roman numeral, created from either a string of numerals or an integer.
+
+    Numerals hash, compare and add, subtract and multiply by their integer
+    value; the string of numerals is only worked out when it is asked for.
+    Numerals for the values 1 to 3999 are interned, so creating the same
+    one again returns the existing instance without converting anything.
+
+    RAISES
+        ValueError - as asDecimal or asNumerals
+    """
+    __slots__ = ('__value', '__numerals')
+
+    def __new__(cls, value):
+        numeral = _INTERNED.get(value)
+        if numeral is not None:
+            return numeral
         if isinstance(value, str):
-            self.__value = asDecimal(value)
-            self.__numerals = value
+            numerals = value
+            value = asDecimal(numerals)
+            if value in _INTERNED_RANGE and _encode(value) == numerals:
+                numeral = cls(value)
+                _INTERNED[numerals] = numeral
+                return numeral
         else:
-            self.__value = value
-            self.__numerals = asNumerals(value)
+            if value < 1:
+                raise ValueError("out of range %d" % (value))
+            numerals = None
+
+        numeral = object.__new__(cls)
+        numeral.__value = value
+        numeral.__numerals = numerals
+        if numerals is None and type(value) is int and value in _INTERNED_RANGE:
+            _INTERNED[value] = numeral
+        return numeral
+
+    def __reduce__(self):
+        if self.__numerals is None:
+            return (self.__class__, (self.__value,))
+        return (self.__class__, (self.__numerals,))
 
     def __repr__(self):
         return object.__repr__(self)
 
     def __str__(self):
+        if self.__numerals is None:
+            self.__numerals = asNumerals(self.__value)
         return self.__numerals
 
     def __int__(self):
         return self.__value
 
+    def __hash__(self):
+        return hash(self.__value)
+
     def __eq__(self, other):
         if isinstance(other, Numeral):
             return self.__value == other.__value
         return False
+
+    def __lt__(self, other):
+        if isinstance(other, Numeral):
+            return self.__value < other.__value
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Numeral):
+            return Numeral(self.__value + other.__value)
+        if isinstance(other, int):
+            return Numeral(self.__value + other)
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Numeral):
+            return Numeral(self.__value - other.__value)
+        if isinstance(other, int):
+            return Numeral(self.__value - other)
+        return NotImplemented
+
+    def __rsub__(self, other):
+        if isinstance(other, int):
+            return Numeral(other - self.__value)
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, Numeral):
+            return Numeral(self.__value * other.__value)
+        if isinstance(other, int):
+            return Numeral(self.__value * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
@@ -0,0 +1,273 @@
+"""
+Differential tests and benchmarks for the roman module.
+
+Checks a codec (by default roman itself) against the original reference
+implementation by round-tripping every value from 1 to 3999 and fuzzing
+random strings, then times it, reporting any mismatches, per-call latency
+and batch throughput as JSON.
+
+$ python roman_benchmark.py --fuzz 100000 --codec my_fast_roman
+"""
+import argparse
+import importlib
+import json
+import random
+import sys
+import time
+
+# the reference implementation, as roman was originally written, with its
+# own copy of the tables so that changes to roman can't change it too
+
+_REFERENCE_VALUES = {
+    'I':     1,
+    'II':    2,
+    'III':   3,
+    'IV':    4,
+    'V':     5,
+    'IX':    9,
+    'X':    10,
+    'XX':   20,
+    'XXX':  30,
+    'XL':   40,
+    'L':    50,
+    'XC':   90,
+    'C':   100,
+    'CC':  200,
+    'CCC': 300,
+    'CD':  400,
+    'D':   500,
+    'CM':  900,
+    'M':  1000,
+}
+
+_REFERENCE_BY_LENGTH = sorted(
+    _REFERENCE_VALUES.keys(),
+    key=lambda k: len(k),
+    reverse=True
+)
+
+_REFERENCE_BY_SIZE = sorted(
+    _REFERENCE_VALUES.items(),
+    key=lambda item: item[1],
+    reverse=True
+)
+
+# the kinds of ValueError the reference raises
+_REFERENCE_FAILURES = (
+    'unrecognised numeral',
+    'increasing value',
+    'bad repetition',
+    'out of range',
+)
+
+
+def referenceAsDecimal(string):
+    numerals = []
+    values = []
+    while(string):
+        for numeral in _REFERENCE_BY_LENGTH:
+            if string.startswith(numeral):
+                break
+        else:
+            raise ValueError("unrecognised numeral %s[%s]" % (''.join(numerals), string))
+        string = string[len(numeral):]
+
+        value = _REFERENCE_VALUES[numeral]
+        context = "%s[%s]%s" % ("".join(numerals), numeral, string)
+        if (values and (value > values[-1])):
+            raise ValueError("increasing value %s" % (context))
+        if (numerals and numeral != 'M' and (numeral[0] == numerals[-1][-1])):
+            raise ValueError("bad repetition %s" % (context))
+
+        values.append(value)
+        numerals.append(numeral)
+    return sum(values)
+
+
+def referenceAsNumerals(value):
+    if value < 1:
+        raise ValueError("out of range %d" % (value))
+    numerals = []
+    while(value):
+        for (numeral, v) in _REFERENCE_BY_SIZE:
+            if v <= value:
+                numerals.append(numeral)
+                value -= v
+                break
+    return "".join(numerals)
+
+
+def errorKind(error):
+    """
+    Returns the kind of a conversion ValueError e.g. 'bad repetition'
+    """
+    message = str(error)
+    for kind in _REFERENCE_FAILURES:
+        if message.startswith(kind):
+            return kind
+    return message
+
+
+def outcome(convert, value):
+    """
+    Returns (RESULT, None) or (None, ERROR KIND) for convert(value)
+    """
+    try:
+        return (convert(value), None)
+    except ValueError as error:
+        return (None, errorKind(error))
+
+
+def randomStrings(count, seed=0, lengths=(0, 10), characters="IVXLCDMivx Q"):
+    """
+    Returns count random strings, mostly of numerals and mostly invalid
+        lengths    - the (shortest, longest) length of a string
+        characters - the characters to make the strings from
+    """
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(characters) for _ in range(rng.randint(*lengths)))
+        for _ in range(count)
+    ]
+
+
+def differences(codec, strings, values=range(1, 4000)):
+    """
+    Returns a list of the conversions where codec disagrees with the
+    reference implementation, each in the form
+        {"function": NAME, "input": VALUE, "expected": OUTCOME, "actual": OUTCOME}
+
+    codec   - a module with asDecimal and asNumerals, and optionally
+              asDecimalMany and asNumeralsMany
+    strings - strings to convert with asDecimal
+    values  - integers to round-trip through asNumerals and asDecimal
+    """
+    found = []
+
+    def compare(function, value, expected, actual):
+        if expected != actual:
+            found.append({
+                "function": function,
+                "input": value,
+                "expected": expected,
+                "actual": actual,
+            })
+
+    for value in values:
+        numerals = outcome(codec.asNumerals, value)
+        compare("asNumerals", value, outcome(referenceAsNumerals, value), numerals)
+        if numerals[0] is not None:
+            compare("asDecimal", numerals[0], (value, None), outcome(codec.asDecimal, numerals[0]))
+    for string in strings:
+        compare("asDecimal", string, outcome(referenceAsDecimal, string), outcome(codec.asDecimal, string))
+
+    if hasattr(codec, "asNumeralsMany"):
+        values = list(values) + [0, -1, 4000, 4444]
+        for (value, result, error) in zip(values, *codec.asNumeralsMany(values)):
+            actual = (result, error and errorKind(error))
+            compare("asNumeralsMany", value, outcome(referenceAsNumerals, value), actual)
+    if hasattr(codec, "asDecimalMany"):
+        for (string, result, error) in zip(strings, *codec.asDecimalMany(strings)):
+            actual = (result, error and errorKind(error))
+            compare("asDecimalMany", string, outcome(referenceAsDecimal, string), actual)
+    return found
+
+
+def latency(convert, inputs, repeat=5):
+    """
+    Returns the mean nanoseconds per call of convert over the inputs, from
+    the fastest of repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for value in inputs:
+            try:
+                convert(value)
+            except ValueError:
+                pass
+        elapsed = time.perf_counter_ns() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(inputs)
+
+
+def throughput(convertMany, inputs, repeat=5):
+    """
+    Returns the values converted per second by a batch function, from the
+    fastest of repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        convertMany(inputs)
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(inputs) / best if best else None
+
+
+def run(codec, fuzz=10000, seed=0, repeat=5):
+    """
+    Compares and times codec, returning a dictionary of the results
+    """
+    strings = randomStrings(fuzz, seed)
+    values = list(range(1, 4000))
+    numerals = [referenceAsNumerals(value) for value in values]
+    mismatches = differences(codec, strings, values)
+
+    timings = {}
+    for (name, module) in [("reference", None), ("codec", codec)]:
+        if module is None:
+            (asDecimal, asNumerals) = (referenceAsDecimal, referenceAsNumerals)
+        else:
+            (asDecimal, asNumerals) = (module.asDecimal, module.asNumerals)
+        timings[name] = {
+            "asNumerals_ns": latency(asNumerals, values, repeat),
+            "asDecimal_ns": latency(asDecimal, numerals, repeat),
+            "asDecimal_fuzz_ns": latency(asDecimal, strings, repeat),
+        }
+    batches = {}
+    if hasattr(codec, "asNumeralsMany"):
+        batches["asNumeralsMany_per_second"] = throughput(codec.asNumeralsMany, values, repeat)
+    if hasattr(codec, "asDecimalMany"):
+        batches["asDecimalMany_per_second"] = throughput(codec.asDecimalMany, numerals, repeat)
+
+    return {
+        "codec": codec.__name__,
+        "seed": seed,
+        "fuzzed": len(strings),
+        "round_tripped": len(values),
+        "mismatches": len(mismatches),
+        "first_mismatches": mismatches[:10],
+        "latency": timings,
+        "throughput": batches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--codec", default="roman",
+        help="the module to test, it must have asDecimal and asNumerals"
+    )
+    parser.add_argument("--fuzz", type=int, default=10000, help="random strings to try")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--output", help="write the JSON results to a file instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(importlib.import_module(args.codec), args.fuzz, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 1 if results["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
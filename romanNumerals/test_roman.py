@@ -86,3 +86,155 @@ def test_to_two_thousand():
                 )
             )
         ) == i
+
+
+@pytest.mark.parametrize(
+    "value, numerals",
+    [
+        (3999, 'MMMCMXCIX'),
+        (4000, 'MMMM'),
+        (4444, 'MMMMCDXLIV'),
+        (888, 'DCCCLXXXVIII'),
+    ]
+)
+def test_as_numerals(value, numerals):
+    assert roman.asNumerals(value) == numerals
+    assert roman.asDecimal(numerals) == value
+
+
+def test_as_numerals_many():
+    (numerals, errors) = roman.asNumeralsMany([1, 0, 1998, -1])
+    assert numerals == ['I', None, 'MCMXCVIII', None]
+    assert errors[0] is None and errors[2] is None
+    assert [str(error) for error in errors[1::2]] == ['out of range 0', 'out of range -1']
+
+
+def test_as_numerals_many_numpy():
+    numpy = pytest.importorskip("numpy")
+    values = numpy.arange(-2, 4500)
+    (numerals, errors) = roman.asNumeralsMany(values)
+    assert numerals == roman.asNumeralsMany(values.tolist())[0]
+    assert [str(error) for error in errors[:3]] == [
+        'out of range -2', 'out of range -1', 'out of range 0'
+    ]
+    assert errors[3:] == [None] * (len(values) - 3)
+
+
+def test_as_decimal_many():
+    (values, errors) = roman.asDecimalMany(['XI', 'IIII', 'XI', '', 'IC'])
+    assert values == [11, None, 11, 0, None]
+    assert [str(error) if error else None for error in errors] == [
+        None, 'bad repetition III[I]', None, None, 'increasing value I[C]'
+    ]
+
+
+def test_numerals_are_interned():
+    assert roman.Numeral(12) is roman.Numeral('XII')
+    assert roman.Numeral('XII') is roman.Numeral(12)
+    assert roman.Numeral(4000) is not roman.Numeral(4000)
+    # numerals that are valid but not how asNumerals writes the value
+    assert str(roman.Numeral('IVI')) == 'IVI'
+    assert roman.Numeral('IVI') == roman.Numeral(5)
+    with pytest.raises(AttributeError):
+        roman.Numeral(5).extra = True
+
+
+def test_numeral_hashing_and_ordering():
+    numerals = {roman.Numeral('X'): 'ten', roman.Numeral(5): 'five'}
+    assert numerals[roman.Numeral(10)] == 'ten'
+    assert sorted([roman.Numeral(10), roman.Numeral('IV'), roman.Numeral(7)]) == [
+        roman.Numeral(4), roman.Numeral(7), roman.Numeral(10)
+    ]
+    assert roman.Numeral('IX') <= roman.Numeral(9) < roman.Numeral('X')
+    with pytest.raises(TypeError):
+        roman.Numeral(1) < 2
+
+
+def test_numeral_arithmetic():
+    assert str(roman.Numeral('XII') + roman.Numeral('III')) == 'XV'
+    assert str(roman.Numeral(1000) * 4) == 'MMMM'
+    assert str(2 * roman.Numeral('X') - 1) == 'XIX'
+    assert int(100 - roman.Numeral('I')) == 99
+    with pytest.raises(ValueError) as err:
+        roman.Numeral('V') - 5
+    assert str(err.value) == 'out of range 0'
+
+
+def test_trace():
+    messages = []
+    roman.setTrace(messages.append)
+    try:
+        roman.asDecimal('XII')
+        roman.asNumerals(12)
+        roman.asDecimalMany(['I', 'II'])
+    finally:
+        roman.setTrace(None)
+    roman.asDecimal('XII')
+    assert messages == ['asDecimal(XII)', 'asNumerals(12)', 'asDecimalMany(2 strings)']
+
+
+def test_stats():
+    roman.resetStats()
+    roman.asDecimal('X')
+    assert roman.getStats()['calls'] == 0
+
+    roman.enableStats()
+    try:
+        roman.asDecimal('X')
+        for bad_value in ['IIII', 'IC', 'Q']:
+            with pytest.raises(ValueError):
+                roman.asDecimal(bad_value)
+        roman.asNumeralsMany([1, 0, -1])
+        roman.asDecimalMany(['X', 'VX'])
+        stats = roman.getStats()
+    finally:
+        roman.enableStats(False)
+        roman.resetStats()
+    assert stats['calls'] == 9
+    assert stats['failures'] == {
+        'unrecognised numeral': 1,
+        'increasing value': 2,
+        'bad repetition': 1,
+        'out of range': 2,
+    }
+    assert stats['seconds'] > 0
+
+
+def test_matches_reference():
+    import roman_benchmark
+    strings = roman_benchmark.randomStrings(2000, seed=1)
+    assert roman_benchmark.differences(roman, strings) == []
+
+
+def test_many_records_bad_types():
+    (numerals, errors) = roman.asNumeralsMany([1, None, 2.5, 3])
+    assert numerals == ['I', None, None, 'III']
+    assert [type(error) for error in errors] == [type(None), TypeError, TypeError, type(None)]
+    (values, errors) = roman.asDecimalMany(['XI', None, ['X']])
+    assert values == [11, None, None]
+    assert [type(error) for error in errors] == [type(None), TypeError, TypeError]
+
+
+def test_as_numerals_many_numpy_bad_values():
+    numpy = pytest.importorskip("numpy")
+    (numerals, errors) = roman.asNumeralsMany(numpy.array([1.0, numpy.nan]))
+    assert numerals[1] is None and isinstance(errors[1], TypeError)
+    (numerals, errors) = roman.asNumeralsMany(numpy.array([2, 2 ** 64 - 1], dtype=numpy.uint64))
+    assert numerals == ['II', None]
+    assert str(errors[1]) == 'out of range 18446744073709551615'
+
+
+def test_numeral_counts_one_conversion():
+    messages = []
+    roman.setTrace(messages.append)
+    roman.enableStats()
+    roman.resetStats()
+    try:
+        roman.Numeral('MMXIII')
+        stats = roman.getStats()
+    finally:
+        roman.setTrace(None)
+        roman.enableStats(False)
+        roman.resetStats()
+    assert messages == ['asDecimal(MMXIII)']
+    assert stats['calls'] == 1
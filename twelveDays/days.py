@@ -1,4 +1,4 @@
-from __future__ import print_function
+import sys
 
 days = [
     ["first", "a partridge in a pear tree"],
@@ -16,19 +16,44 @@ days = [
 ]
 
 
-def printDays(day):
-    for d in range(day, -1, -1):
-        if (day > 0 and d == 0):
-            print("and", end=' ')
-        print(days[d][1])
+def verses(gifts=days, count=None):
+    """
+    Generate the verses of the song, each followed by a blank line.
+        gifts - a list of [ORDINAL, GIFT] pairs, one for each day
+        count - the number of days to sing, defaults to all of the gifts
 
+    Each verse's gifts are the new gift followed by the previous verse's
+    gifts, so nothing is worked out more than once.
 
-def printVerse(day):
-    print("On the %s day of christmas" % days[day][0])
-    print("My true love gave to me")
-    printDays(day)
+    RAISES
+        ValueError
+        - when count is more than the number of gifts
+    """
+    if count is None:
+        count = len(gifts)
+    if count > len(gifts):
+        raise ValueError("%d days but only %d gifts" % (count, len(gifts)))
+    return _verses(gifts[:count])
 
 
-for d in range(0, 12):
-    printVerse(d)
-    print()
+def _verses(gifts):
+    given = ""
+    for (day, (ordinal, gift)) in enumerate(gifts):
+        if day == 0:
+            lines = gift + "\n"
+            given = "and " + lines
+        else:
+            lines = gift + "\n" + given
+            given = lines
+        yield "On the %s day of christmas\nMy true love gave to me\n%s\n" % (ordinal, lines)
+
+
+def render(gifts=days, count=None):
+    """
+    Returns the whole song as a string, see verses.
+    """
+    return "".join(verses(gifts, count))
+
+
+if __name__ == "__main__":
+    sys.stdout.write(render())